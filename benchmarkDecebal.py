@@ -0,0 +1,338 @@
+# This Python file uses the following encoding: utf-8
+'''
+Machine readable benchmarks for mathDecebal and utilDecebal
+
+Every case is run several times after a warm-up, every repeat is a loop
+that takes at least 0.2 seconds. For every case the minimum, median,
+maximum and spread (maximum - minimum) of the time per call are saved as
+JSON.
+A run can be compared with a saved baseline: when a case is more as
+threshold slower the program exits with 1, so it can be used in CI.
+
+Usage:
+    benchmarkDecebal.py [--groups=factorial,fibonacci,happy,lucky,moving_average]
+                        [--repeats=5] [--warmup=1] [--seed=0]
+                        [--output=results.json]
+                        [--baseline=baseline.json] [--threshold=0.25]
+'''
+
+# We write our code for Python3, but want it to work with Python2 also
+from __future__     import division, print_function
+
+# imports
+import getopt
+import json
+import platform
+import random
+import sys
+
+# froms
+from os.path        import expanduser, split
+from time           import strftime
+
+import mathDecebal
+
+from timeDecebal    import time_callable
+from utilDecebal    import MovingAverage, MovingMaximum, MovingMedian, MovingMinimum
+from utilDecebal    import TimedMessage
+
+
+##### Exception Classes
+
+
+##### Classes
+
+
+##### Functions
+
+def compare_results(baseline, results, threshold):
+    '''
+    Compare results with a baseline (both as given by run_benchmarks)
+    A case is slower when its minimum is more as threshold (0.25 is 25%)
+    above the minimum of the baseline
+    Cases that are not in both are ignored
+    Returns a list with a dictionary for every slower case
+    '''
+
+    regressions = []
+    for name, current in sorted(results['cases'].items()):
+        if name not in baseline['cases']:
+            continue
+        old_min = baseline['cases'][name]['min']
+        ratio   = current['min'] / old_min if old_min > 0 else float('inf')
+        if ratio > 1 + threshold:
+            regressions.append({
+                'name':         name,
+                'baseline_min': old_min,
+                'min':          current['min'],
+                'ratio':        ratio,
+            })
+    return regressions
+
+def get_baseline(filename):
+    '''Get results saved with save_results'''
+
+    with open(expanduser(filename), 'r') as in_f:
+        return json.load(in_f)
+
+def get_cases(groups = None):
+    '''
+    Returns the benchmark cases as a list of (group, name, function, args)
+    When groups is given only the cases of those groups are returned
+    '''
+
+    if groups is None:
+        groups = _groups
+    unknown = set(groups) - set(_groups)
+    if unknown:
+        raise ValueError('Unknown groups: {0}'.format(', '.join(sorted(unknown))))
+    return [case for case in _cases if case[0] in groups]
+
+def _moving_average(length, precise = False, resum_every = None):
+    '''Feed _moving_average_values to a MovingAverage one by one'''
+
+    average = MovingAverage(length, precise, resum_every)
+    for value in _moving_average_values:
+        average.next_value(value)
+    return average.current_value()
+
+def _moving_window(moving, length, n):
+    '''Feed the first n _moving_average_values to moving(length)'''
+
+    window = moving(length)
+    for value in _moving_average_values[:n]:
+        window.next_value(value)
+    return window.current_value()
+
+def _moving_window_naive(function, length, n):
+    '''Calculate function for every window of the first n _moving_average_values'''
+
+    for i in range(n):
+        function(_moving_average_values[max(0, i + 1 - length):i + 1])
+
+def _naive_median(window):
+    '''Median by sorting the window'''
+
+    ordered = sorted(window)
+    middle  = len(ordered) // 2
+    if len(ordered) % 2 == 1:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+def run_benchmarks(groups = None, repeats = 5, warmup = 1, seed = 0,
+                   notifier = None):
+    '''
+    Run the cases of groups and return a dictionary with the results
+    The random generators are seeded with seed before every case
+    When a notifier (TimedMessage) is given progress is reported with it
+    '''
+
+    results = {
+        'meta': {
+            'date':         strftime('%Y-%m-%d %H:%M:%S'),
+            'python':       platform.python_version(),
+            'platform':     platform.platform(),
+            'repeats':      repeats,
+            'warmup':       warmup,
+            'seed':         seed,
+        },
+        'cases': {},
+    }
+    for group, name, function, args in get_cases(groups):
+        if notifier is not None:
+            notifier.give_msg('Timing {0}: '.format(name), use_newline = False)
+        case = run_case(function, args, repeats, warmup, seed)
+        case['group']           = group
+        results['cases'][name]  = case
+        if notifier is not None:
+            print('{0:.3E} (median {1:.3E}, spread {2:.3E})'.
+                  format(case['min'], case['median'], case['spread']))
+    return results
+
+def run_case(function, args, repeats = 5, warmup = 1, seed = 0):
+    '''
+    Time function(*args) repeats times after warmup calls
+    Every repeat calls function loops times, with loops calibrated by
+    time_callable so a repeat takes at least 0.2 seconds: one call of some
+    microseconds can not be timed reliably. Garbage collection is disabled
+    during the timing.
+    Returns a dictionary with min, median, max, spread and all times per
+    call, and the loops
+    '''
+
+    if repeats < 1:
+        raise ValueError('You should time at least once')
+    if warmup < 0:
+        raise ValueError('Warm-up cannot be negative')
+    _seed(seed)
+    for i in range(warmup):
+        function(*args)
+    loops = time_callable(function, args, repeats = 1).loops
+    times = []
+    for i in range(repeats):
+        _seed(seed)
+        times.append(time_callable(function, args, repeats = 1, loops = loops).best)
+    times.sort()
+    middle = len(times) // 2
+    if len(times) % 2 == 1:
+        median = times[middle]
+    else:
+        median = (times[middle - 1] + times[middle]) / 2
+    return {
+        'min':      times[0],
+        'median':   median,
+        'max':      times[-1],
+        'spread':   times[-1] - times[0],
+        'times':    times,
+        'loops':    loops,
+    }
+
+def save_results(results, filename):
+    '''Save results as JSON'''
+
+    with open(expanduser(filename), 'w') as out_f:
+        json.dump(results, out_f, indent = 2, sort_keys = True)
+
+def _seed(seed):
+    '''Seed the random generators, so every run uses the same numbers'''
+
+    random.seed(seed)
+    if mathDecebal.numpy is not None:
+        mathDecebal.numpy.random.seed(seed)
+
+
+##### Init
+
+# variables
+
+_cases  = [
+    ('factorial', 'factorial_iterative(20000)',
+     mathDecebal.factorial_iterative,               (20000,)),
+    ('factorial', 'factorial_tail_recursion(20000)',
+     mathDecebal.factorial_tail_recursion,          (20000,)),
+    ('factorial', 'factorial_fast(20000)',
+     mathDecebal.factorial_fast,                    (20000,)),
+    ('factorial', 'factorial_fast(200000)',
+     mathDecebal.factorial_fast,                    (200000,)),
+    ('fibonacci', 'fibonacci_iterative(20000)',
+     mathDecebal.fibonacci_iterative,               (20000,)),
+    ('fibonacci', 'fibonacci_memoize_after_clearing(300)',
+     mathDecebal.fibonacci_memoize_after_clearing,  (300,)),
+    ('fibonacci', 'fibonacci_memoize_trampoline_after_clearing(10000)',
+     mathDecebal.fibonacci_memoize_trampoline_after_clearing, (10000,)),
+    ('fibonacci', 'fibonacci_fast(20000)',
+     mathDecebal.fibonacci_fast,                    (20000,)),
+    ('fibonacci', 'fibonacci_fast(1000000)',
+     mathDecebal.fibonacci_fast,                    (1000000,)),
+    ('fibonacci', 'fibonacci_batch(range(0, 100000, 97))',
+     mathDecebal.fibonacci_batch,                   (range(0, 100000, 97),)),
+    ('fibonacci', 'fibonacci_mod(range(100000), 1000003)',
+     mathDecebal.fibonacci_mod,                     (range(100000), 1000003)),
+    ('happy',     'happy_numbers_list(1000000)',
+     mathDecebal.happy_numbers_list,                (1000000,)),
+    ('happy',     'happy_numbers_count_old(1000000)',
+     mathDecebal.happy_numbers_count_old,           (1000000,)),
+    ('happy',     'happy_numbers_count(10 ** 18)',
+     mathDecebal.happy_numbers_count,               (10 ** 18,)),
+    ('lucky',     'lucky_numbers_old(1000000)',
+     mathDecebal.lucky_numbers_old,                 (1000000,)),
+    ('lucky',     'lucky_numbers(1000000)',
+     mathDecebal.lucky_numbers,                     (1000000,)),
+    ('lucky',     'lucky_numbers_count(10000000)',
+     mathDecebal.lucky_numbers_count,               (10000000,)),
+    ('lucky',     'is_lucky(9999999)',
+     mathDecebal.is_lucky,                          (9999999,)),
+    ('moving_average', 'MovingAverage(100) rolling',
+     _moving_average,                               (100,)),
+    ('moving_average', 'MovingAverage(100) precise',
+     _moving_average,                               (100, True)),
+    ('moving_average', 'MovingAverage(100) resum every value',
+     _moving_average,                               (100, True, 1)),
+    ('moving_average', 'MovingMaximum(1000) 20000 values',
+     _moving_window,                                (MovingMaximum, 1000, 20000)),
+    ('moving_average', 'naive max(1000) 20000 values',
+     _moving_window_naive,                          (max, 1000, 20000)),
+    ('moving_average', 'MovingMinimum(1000) 20000 values',
+     _moving_window,                                (MovingMinimum, 1000, 20000)),
+    ('moving_average', 'naive min(1000) 20000 values',
+     _moving_window_naive,                          (min, 1000, 20000)),
+    ('moving_average', 'MovingMedian(1000) 20000 values',
+     _moving_window,                                (MovingMedian, 1000, 20000)),
+    ('moving_average', 'naive median(1000) 20000 values',
+     _moving_window_naive,                          (_naive_median, 1000, 20000)),
+]
+_groups = ['factorial', 'fibonacci', 'happy', 'lucky', 'moving_average']
+# Values with a big offset that comes and goes, so rolling totals drift
+_random                 = random.Random(0)
+_moving_average_values  = [
+    _random.gauss(0, 1) + (1e9 if i % 1000 < 500 else 0.0)
+    for i in range(10 ** 5)
+]
+
+# functions
+
+# __main__
+if __name__ == '__main__':
+    keywords        = [
+        'baseline=',
+        'groups=',
+        'output=',
+        'repeats=',
+        'seed=',
+        'threshold=',
+        'warmup=',
+    ]
+    notify          = TimedMessage()
+    progname        = split(sys.argv[0])[1]
+    try:
+        (options,
+         extraParams)   = getopt.getopt(sys.argv[1:], '', keywords)
+    except getopt.GetoptError as error:
+        print('{0}: {1}'.format(progname, error), file = sys.stderr)
+        sys.exit(2)
+    if len(extraParams) != 0:
+        print('{0}: Wrong parameters ({1})'.
+              format(progname, ' '.join(extraParams)), file = sys.stderr)
+        sys.exit(2)
+
+    baseline_file   = None
+    groups          = None
+    output_file     = None
+    repeats         = 5
+    seed            = 0
+    threshold       = 0.25
+    warmup          = 1
+    for option, value in options:
+        if   option == '--baseline':
+            baseline_file   = value
+        elif option == '--groups':
+            groups          = value.split(',')
+        elif option == '--output':
+            output_file     = value
+        elif option == '--repeats':
+            repeats         = int(value)
+        elif option == '--seed':
+            seed            = int(value)
+        elif option == '--threshold':
+            threshold       = float(value)
+        elif option == '--warmup':
+            warmup          = int(value)
+
+    try:
+        results = run_benchmarks(groups, repeats, warmup, seed, notify)
+    except ValueError as error:
+        print('{0}: {1}'.format(progname, error), file = sys.stderr)
+        sys.exit(2)
+    if output_file is not None:
+        save_results(results, output_file)
+        notify.give_msg('Results saved in {0}'.format(output_file))
+    if baseline_file is not None:
+        regressions = compare_results(get_baseline(baseline_file), results, threshold)
+        for regression in regressions:
+            notify.give_msg('{0} is {1:.2f} times slower ({2:.3E} / {3:.3E})'.
+                            format(regression['name'], regression['ratio'],
+                                   regression['min'], regression['baseline_min']))
+        if regressions:
+            sys.exit(1)
+        notify.give_msg('No case more as {0:.0%} slower as {1}'.
+                        format(threshold, baseline_file))
@@ -7,15 +7,33 @@ import getopt
 import math
 import sys
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# Python 2 has no math.gcd
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
+# Python 2 has no concurrent.futures without the futures backport
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
 # To limit the stack trace with a recursive error
 sys.tracebacklimit = 10
 
 import utilDecebal
 
-from os.path        import split
-from timeit         import timeit
+from array                  import array
+from collections            import OrderedDict
+from numbers                import Integral
+from os.path                import split
+from timeit                 import timeit
 
-from utilDecebal    import memoize
+from utilDecebal            import memoize, parallel_sweep
 
 
 ##### Functions
@@ -42,6 +60,115 @@ def ackermann2(m, n):
     else:
         return ackermann2(m - 1, ackermann2(m, n - 1))
 
+# The cache of ackermann_fast keeps the last used values
+_ackermann_cache        = OrderedDict()
+_ackermann_cache_size   = 10 ** 4
+# Bigger powers of two are not calculated
+_ackermann_max_exponent = 2 ** 24
+
+def ackermann_fast(m, n):
+    '''
+    Ackermann without recursion
+    For m <= 3 the closed forms are used and for m = 4 tetration:
+    A(4, n) = 2^^(n + 3) - 3
+    For bigger m an explicit stack is used and the calculated values are
+    cached in a bounded cache, so values like A(4, 2) and A(5, 0) work
+    without touching the recursion limit
+    Raises OverflowError when the result is too large to calculate
+    '''
+
+    assert (m >= 0) and (n >= 0)
+    # A(5, 1) = A(4, 65533) needs a power far above _ackermann_max_exponent,
+    # and every A(5, n) with n > 0 and A(6, n) is bigger. Raise before
+    # filling the stack with n entries.
+    if (m > 5) or ((m == 5) and (n > 0)):
+        raise OverflowError('Ackermann value too large to calculate')
+    # Every entry is the key for the value of the current calculation,
+    # or when an m is given, that A(m, value) has to be calculated for key
+    pending = []
+    while True:
+        key = (m, n)
+        if m <= 4:
+            value = _ackermann_closed(m, n)
+        elif key in _ackermann_cache:
+            # Python 2 does not have move_to_end
+            value = _ackermann_cache.pop(key)
+            _ackermann_cache[key] = value
+        elif n == 0:
+            pending.append((key, None))
+            m, n = m - 1, 1
+            continue
+        else:
+            pending.append((key, m - 1))
+            n -= 1
+            continue
+        while pending:
+            key, next_m = pending.pop()
+            if next_m is not None:
+                pending.append((key, None))
+                m, n = next_m, value
+                break
+            _ackermann_cache[key] = value
+            while len(_ackermann_cache) > _ackermann_cache_size:
+                _ackermann_cache.popitem(last = False)
+        else:
+            return value
+
+def _ackermann_closed(m, n):
+    '''
+    Closed forms of Ackermann for m <= 4
+    '''
+
+    if m == 0:
+        return n + 1
+    elif m == 1:
+        return n + 2
+    elif m == 2:
+        return 2 * n + 3
+    elif m == 3:
+        return _ackermann_power(n + 3) - 3
+    value = 1
+    for i in range(n + 3):
+        value = _ackermann_power(value)
+    return value - 3
+
+def _ackermann_power(exponent):
+    '''
+    2 ** exponent, but OverflowError when exponent is too big
+    '''
+
+    if exponent > _ackermann_max_exponent:
+        raise OverflowError('Ackermann value too large to calculate')
+    return 2 ** exponent
+
+# Below this starting processes costs more as it gains
+_factorial_parallel_min = 10 ** 4
+
+def factorial_fast(x, workers = None):
+    '''
+    Factorial using a balanced product tree
+    Big integers are multiplied with numbers of about the same size,
+    which is a lot cheaper as multiplying one by one
+    With workers the subtrees are multiplied in that many processes
+    '''
+
+    assert x >= 0
+    if x < 2:
+        return 1
+    if (workers is None) or (workers < 2) or (x < _factorial_parallel_min):
+        return _product_range(2, x + 1)
+    if ProcessPoolExecutor is None:
+        raise ImportError('factorial_fast with workers needs concurrent.futures')
+    chunks  = workers * 4
+    bounds  = [2 + (x - 1) * i // chunks for i in range(chunks + 1)]
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        products = list(executor.map(_product_range, bounds[:-1], bounds[1:]))
+    while len(products) > 1:
+        products = [products[i] * products[i + 1] if i + 1 < len(products)
+                    else products[i]
+                    for i in range(0, len(products), 2)]
+    return products[0]
+
 def factorial_iterative(x):
     assert x >= 0
     result = 1
@@ -84,12 +211,29 @@ def factorial_tail_recursion_old(x):
         y *= x
         x -= 1
 
+def _factorize(n):
+    '''
+    Returns a dictionary with the prime factors of n and their powers
+    Uses trial division, so it is O(sqrt(n)) when n is a prime
+    '''
+
+    factors = {}
+    divisor = 2
+    while divisor * divisor <= n:
+        while n % divisor == 0:
+            factors[divisor] = factors.get(divisor, 0) + 1
+            n //= divisor
+        divisor += 1 if divisor == 2 else 2
+    if n > 1:
+        factors[n] = factors.get(n, 0) + 1
+    return factors
+
 def fibonacci(n):
     '''
-    Calculates fibonacci number, uses fibonacci_iterative
+    Calculates fibonacci number, uses fibonacci_fast
     '''
 
-    return fibonacci_iterative(n)
+    return fibonacci_fast(n)
 
 def fibonacci_analytic(n):
     assert n >= 0
@@ -100,6 +244,50 @@ def fibonacci_analytic(n):
     q       = 1 / p
     return int((p ** n + q ** n) / sqrt_5 + 0.5 )
 
+def fibonacci_batch(numbers):
+    '''
+    Calculates the fibonacci numbers for all values in numbers
+    Returns a list in the same order as numbers
+    Intermediate doublings are shared between the values, so values with
+    a common binary prefix are only partly recalculated
+    '''
+
+    pairs   = { 0: (0, 1) }
+    results = []
+    for n in numbers:
+        assert n >= 0
+        path = []
+        m    = n
+        while m not in pairs:
+            path.append(m)
+            m >>= 1
+        for m in reversed(path):
+            pairs[m] = _fibonacci_double(pairs[m >> 1], m & 1)
+        results.append(pairs[n][0])
+    return results
+
+def _fibonacci_double(pair, add_one):
+    '''
+    From (F(k), F(k + 1)) calculate (F(2k), F(2k + 1))
+    or when add_one is True (F(2k + 1), F(2k + 2))
+    '''
+
+    a, b    = pair
+    even    = a * (2 * b - a)
+    odd     = a * a + b * b
+    if add_one:
+        return odd, even + odd
+    return even, odd
+
+def fibonacci_fast(n):
+    '''
+    Fast doubling way of calculating fibonacci
+    Needs only O(log n) big integer multiplications, so fibonacci(10 ** 6)
+    is no problem
+    '''
+
+    return fibonacci_pair(n)[0]
+
 def fibonacci_iterative(n):
     '''
     Iterative way of calculating fibonacci
@@ -138,6 +326,58 @@ def fibonacci_memoize_after_clearing(n):
     fibonacci_memoize()
     return fibonacci_memoize(n)
 
+@memoize(trampoline = True)
+def fibonacci_memoize_trampoline(n):
+    '''
+    fibonacci_memoize with trampoline, so it can be called with big values
+    from an empty cache without running out of stack
+    When called without a parameter it clears the cache
+    '''
+
+    assert n >= 0
+    if (n == 0) or (n == 1):
+        return n
+    else:
+        return fibonacci_memoize_trampoline(n - 1) + fibonacci_memoize_trampoline(n - 2)
+
+def fibonacci_memoize_trampoline_after_clearing(n):
+    '''
+    Calls fibonacci_memoize_trampoline after clearing the cache
+    Especially useful for testing the performance of fibonacci_memoize_trampoline
+    '''
+
+    fibonacci_memoize_trampoline()
+    return fibonacci_memoize_trampoline(n)
+
+def fibonacci_mod(n, m):
+    '''
+    Calculates fibonacci(n) % m without calculating fibonacci(n)
+    n can also be an iterable or a NumPy array, then all values are
+    calculated in one pass: a list, or for a NumPy array an array, is returned
+    For moduli upto _pisano_table_max the values of one Pisano period are
+    cached, which makes every value a table lookup. Larger moduli are not
+    vectorized: every value is calculated on its own with fast doubling, for
+    a NumPy array into an array of dtype object
+    '''
+
+    assert m >= 1
+    table = _pisano_table(m) if m <= _pisano_table_max else None
+    if isinstance(n, Integral):
+        assert n >= 0
+        if table is None:
+            return _fibonacci_pair_mod(n, m)[0]
+        return table[n % len(table)]
+    if (numpy is not None) and isinstance(n, numpy.ndarray):
+        assert (n >= 0).all()
+        if table is None:
+            return numpy.array([_fibonacci_pair_mod(int(i), m)[0] for i in n.flat],
+                               dtype = object).reshape(n.shape)
+        return numpy.frombuffer(table, dtype = table.typecode)[n % len(table)]
+    if table is None:
+        return [_fibonacci_pair_mod(i, m)[0] for i in n]
+    period = len(table)
+    return [table[i % period] for i in n]
+
 def fibonacci_old(n):
     '''
     Standard recursive way of defining Fibonacci
@@ -150,6 +390,33 @@ def fibonacci_old(n):
     else:
         return fibonacci_old(n - 1) + fibonacci_old(n - 2)
 
+def fibonacci_pair(n):
+    '''
+    Returns the tuple (F(n), F(n + 1)) using fast doubling
+    '''
+
+    assert n >= 0
+    pair = (0, 1)
+    for bit in bin(n)[2:]:
+        pair = _fibonacci_double(pair, bit == '1')
+    return pair
+
+def _fibonacci_pair_mod(n, m):
+    '''
+    Returns the tuple (F(n) % m, F(n + 1) % m) using fast doubling
+    '''
+
+    assert n >= 0
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        even    = a * (2 * b - a) % m
+        odd     = (a * a + b * b) % m
+        if bit == '1':
+            a, b = odd, (even + odd) % m
+        else:
+            a, b = even, odd
+    return a, b
+
 def get_ratio(first_val, second_val, do_sort = True):
     '''
     Get the ratio of two numbers, default <= 1
@@ -168,57 +435,238 @@ def happy_number(n):
     '''
 
     assert n >= 1
-    def create_current(n):
-        return int(''.join(sorted(str(n))))
+    current = _square_sum(n)
+    while current >= len(_happy_table):
+        current = _square_sum(current)
+    return _happy_table[current] == 1
 
+def happy_numbers_count(n):
+    '''
+    Counts the happy numbers from 1 upto n
+    Whether a number is happy depends only on the sum of the squares of its
+    digits, so instead of checking every number it is counted how many
+    numbers give every sum (digit DP)
+    Because of this happy_numbers_count(10 ** 18) takes only milliseconds
+    '''
 
-    global _happy_set
-    global _unhappy_set
+    assert n >= 1
+    digits  = [int(digit) for digit in str(n)]
+    length  = len(digits)
+    happy   = [False] + [happy_number(i) for i in range(1, 81 * length + 1)]
+    # sums[r][s] is the number of r digit strings with square sum s
+    sums    = [[1]]
+    for r in range(1, length):
+        current = [0] * (81 * r + 1)
+        for square_sum, ways in enumerate(sums[-1]):
+            for digit in range(10):
+                current[square_sum + digit * digit] += ways
+        sums.append(current)
+    count   = 0
+    prefix  = 0
+    for position, digit in enumerate(digits):
+        rest = sums[length - position - 1]
+        for smaller in range(digit):
+            start  = prefix + smaller * smaller
+            count += sum(ways for square_sum, ways in enumerate(rest)
+                         if happy[start + square_sum])
+        prefix += digit * digit
+    if happy[prefix]:
+        count += 1
+    return count
 
-    run     = set()
-    current = create_current(n)
-    while True:
-        if (current in run) or (current in _unhappy_set):
-            _unhappy_set |= run
-            return False
-        if current in _happy_set:
-            _happy_set |= run
-            return True
-        run.add(current)
-        current = create_current(sum([_squares[value] for value in str(current)]))
+def happy_numbers_count_old(n):
+    '''
+    Counts the happy numbers from 1 upto n by checking every number
+    Used to check happy_numbers_count
+    '''
 
-def happy_numbers_count(n):
     assert n >= 1
-    count = 0
-
-    for i in range(1, n + 1):
-        if happy_number(i):
-            count += 1
-    return count
+    return sum(len(block) for block in iter_happy_numbers(1, n + 1))
 
 # By making this a function it is possible to reset the values for testing purposes
+# A number with d digits has a square sum of at most 81 * d, so after one
+# step every number below 10 ** 20 is in _happy_table
+# The table is only read after this, so happy_number is thread-safe
 def happy_number_init():
-    global _happy_set
+    global _happy_table
     global _squares
-    global _unhappy_set
 
-    _happy_set      = { 1 }
-    _unhappy_set    = set()
-    _squares        = dict((str(i), i*i) for i in range(1, 10))
+    _squares        = [sum(int(digit) ** 2 for digit in str(i)) for i in range(1000)]
+    _happy_table    = bytearray(81 * 20 + 1)
+    for i in range(1, len(_happy_table)):
+        # Every number ends in 1 (happy) or in the cycle containing 4
+        current = i
+        while current not in (1, 4):
+            current = _square_sum(current)
+        _happy_table[i] = 1 if current == 1 else 0
 
 def happy_numbers_list(n):
     assert n >= 1
     found = []
 
-    for i in range(1, n + 1):
-        if happy_number(i):
-            found.append(i)
+    for block in iter_happy_numbers(1, n + 1):
+        found.extend(block.tolist())
     return found
 
+def is_lucky(x):
+    '''
+    Check if a number is a lucky number
+    The position of x is followed through the passes of the sieve until it
+    is removed or it is before the next skip count
+    '''
+
+    assert x >= 1
+    if x % 2 == 0:
+        return False
+    position = (x - 1) // 2
+    for skip_count in _lucky_skip_counts():
+        if skip_count > position + 1:
+            return True
+        if (position + 1) % skip_count == 0:
+            return False
+        position -= position // skip_count
+
+# Python 2 has no typecode 'Q', its 'L' is 64 bits on most platforms
+try:
+    _happy_typecode = array('Q').typecode
+except ValueError:
+    _happy_typecode = 'L'
+
+def iter_happy_numbers(start, stop, chunk = 10 ** 5):
+    '''
+    Generator giving the happy numbers from start upto (not including) stop
+    The numbers are checked in blocks of chunk numbers and for every block
+    an array with its happy numbers is given: a NumPy array when NumPy is
+    available, otherwise an array.array, or a list when the numbers do not
+    fit in one
+    In this way the used memory is bounded by chunk
+    '''
+
+    assert start >= 1
+    assert chunk >= 1
+    use_numpy = (numpy is not None) and (stop <= 2 ** 63)
+    if use_numpy:
+        squares = numpy.array(_squares, dtype = numpy.int64)
+        table   = numpy.frombuffer(_happy_table, dtype = numpy.uint8).astype(bool)
+    if stop <= 2 ** 32:
+        typecode = 'I'
+    elif stop <= 2 ** (8 * array(_happy_typecode).itemsize):
+        typecode = _happy_typecode
+    else:
+        typecode = None
+    for low in range(start, stop, chunk):
+        high = min(low + chunk, stop)
+        if not use_numpy:
+            happy = (i for i in range(low, high) if happy_number(i))
+            yield list(happy) if typecode is None else array(typecode, happy)
+            continue
+        numbers = numpy.arange(low, high, dtype = numpy.int64)
+        rest    = numbers
+        sums    = numpy.zeros_like(numbers)
+        # The numbers are ascending, so when the last is done all are done
+        while rest[-1]:
+            rest, digits    = numpy.divmod(rest, 1000)
+            sums           += squares[digits]
+        # Numbers below 2 ** 63 have at most 19 digits, so sums is in the table
+        yield numbers[table[sums]]
+
+# Block size for lucky_numbers
+# It is also the skip count from where lucky_numbers switches to blocks
+_lucky_block_size = 2 ** 14
+
 def lucky_numbers(n):
     '''
     Lucky numbers from 1 up-to n
     http://en.wikipedia.org/wiki/Lucky_number
+
+    The sieve is kept in an array.array, which needs 4 bytes per number
+    As long as a pass removes a lot of numbers, they are removed with one
+    slice deletion
+    For the later passes that only remove a few numbers the sieve is split
+    in blocks and a Fenwick tree with the block sizes is used to find the
+    numbers, so every removal only needs O(log n) steps and one small
+    block is changed instead of the whole sieve
+    '''
+
+    assert n >= 1
+    if n < 3:
+        return [1]
+    sieve = array('I' if n < 2 ** 32 else 'L', range(1, n + 1, 2))
+    index = 1
+    while index < len(sieve):
+        skip = sieve[index]
+        if skip > len(sieve):
+            return sieve.tolist()
+        if skip > _lucky_block_size:
+            break
+        del sieve[skip - 1 : : skip]
+        index += 1
+    else:
+        return sieve.tolist()
+
+    total       = len(sieve)
+    blocks      = [sieve[i : i + _lucky_block_size]
+                   for i in range(0, total, _lucky_block_size)]
+    del sieve
+    nr_blocks   = len(blocks)
+    # tree is a Fenwick tree with the sizes of the blocks (one based)
+    tree        = [0] * (nr_blocks + 1)
+    for i in range(1, nr_blocks + 1):
+        tree[i] += len(blocks[i - 1])
+        parent   = i + (i & -i)
+        if parent <= nr_blocks:
+            tree[parent] += tree[i]
+    top_step    = 1 << (nr_blocks.bit_length() - 1)
+
+    def locate(position):
+        '''Return the block and the offset in that block of position'''
+
+        node = 0
+        step = top_step
+        while step:
+            next_node = node + step
+            if (next_node <= nr_blocks) and (tree[next_node] <= position):
+                node      = next_node
+                position -= tree[next_node]
+            step >>= 1
+        return node, position
+
+    while index < total:
+        block_nr, offset = locate(index)
+        skip             = blocks[block_nr][offset]
+        if skip > total:
+            break
+        # Remove from the back, then the positions in front do not change
+        for position in range(total - total % skip - 1, skip - 2, -skip):
+            block_nr, offset = locate(position)
+            del blocks[block_nr][offset]
+            node = block_nr + 1
+            while node <= nr_blocks:
+                tree[node] -= 1
+                node       += node & -node
+        total -= total // skip
+        index += 1
+    return [value for block in blocks for value in block]
+
+def lucky_numbers_count(n):
+    '''
+    Number of lucky numbers from 1 up-to n
+    Only the number of remaining numbers is followed through the passes
+    of the sieve, so only the lucky numbers that are used as skip count
+    are needed: about n / log(n) instead of n
+    '''
+
+    assert n >= 1
+    count = (n + 1) // 2
+    for skip_count in _lucky_skip_counts():
+        if skip_count > count:
+            return count
+        count -= count // skip_count
+
+def lucky_numbers_old(n):
+    '''
+    Lucky numbers from 1 up-to n with a list as sieve
+    Used to check lucky_numbers
     '''
 
     assert n >= 1
@@ -237,15 +685,184 @@ def lucky_numbers(n):
         sieve_index += 1
     return sieve
 
-def lucky_numbers_count(n):
-    return len(lucky_numbers(n))
+def _lucky_skip_counts():
+    '''
+    Generator giving the skip counts of the passes of the lucky sieve
+    These are the lucky numbers from 3 on
+    They are sieved in growing steps, so only as much as needed is done
+    '''
+
+    bound = 2 ** 10
+    index = 1
+    while True:
+        skip_counts = lucky_numbers(bound)
+        while index < len(skip_counts):
+            yield skip_counts[index]
+            index += 1
+        bound *= 4
+
+# The periods of the last used moduli above _pisano_table_max are kept
+_pisano_periods         = OrderedDict()
+_pisano_periods_size    = 128
+
+def pisano_period(m):
+    '''
+    Period of fibonacci(n) % m
+    https://en.wikipedia.org/wiki/Pisano_period
+    For moduli above _pisano_table_max the period is calculated from the
+    factors of m and only the period is cached, not the values of the
+    period. The factors are found by trial division, which is O(sqrt(m))
+    when m or (p - 1), (p + 1) of a prime factor p have a big prime factor:
+    fine upto about 10 ** 12 (like 10 ** 9 + 7), slow for bigger primes
+    '''
+
+    assert m >= 1
+    if m <= _pisano_table_max:
+        return len(_pisano_table(m))
+    if m in _pisano_periods:
+        # Python 2 does not have move_to_end
+        period = _pisano_periods.pop(m)
+    else:
+        # The period of p ** k divides p ** (k - 1) times the period of p,
+        # which divides p - 1 or 2 * (p + 1) (3 for 2 and 20 for 5)
+        period = 1
+        for p, k in _factorize(m).items():
+            if p == 2:
+                multiple = 3
+            elif p == 5:
+                multiple = 20
+            elif p % 5 in (1, 4):
+                multiple = p - 1
+            else:
+                multiple = 2 * (p + 1)
+            multiple   *= p ** (k - 1)
+            period      = period * multiple // gcd(period, multiple)
+        # Leave out every prime factor that is not needed for a period
+        for q in _factorize(period):
+            while (period % q == 0) and (_fibonacci_pair_mod(period // q, m) == (0, 1)):
+                period //= q
+        while len(_pisano_periods) >= _pisano_periods_size:
+            _pisano_periods.popitem(last = False)
+    _pisano_periods[m] = period
+    return period
+
+# The tables of the last used moduli are kept
+_pisano_cache       = OrderedDict()
+_pisano_cache_size  = 8
+_pisano_table_max   = 10 ** 6
+
+def _pisano_table(m):
+    '''
+    Returns an array with fibonacci(i) % m for one Pisano period
+    The tables are cached, the least recently used is evicted first
+    '''
+
+    if m in _pisano_cache:
+        # Python 2 does not have move_to_end
+        table = _pisano_cache.pop(m)
+    else:
+        table   = array('I')
+        a, b    = 0, 1 % m
+        while True:
+            table.append(a)
+            a, b = b, (a + b) % m
+            if (a == 0) and (b == 1 % m):
+                break
+        while len(_pisano_cache) >= _pisano_cache_size:
+            _pisano_cache.popitem(last = False)
+    _pisano_cache[m] = table
+    return table
+
+def _product_range(low, high):
+    '''
+    Product of the integers from low upto (not including) high
+    The range is split in halves, so the multiplied numbers have about
+    the same size
+    '''
+
+    if high - low < 16:
+        result = 1
+        for i in range(low, high):
+            result *= i
+        return result
+    middle = (low + high) // 2
+    return _product_range(low, middle) * _product_range(middle, high)
+
+def _square_sum(n):
+    '''
+    Sum of the squares of the digits of n, three digits at a time
+    '''
+
+    total = 0
+    while n:
+        n, rest = divmod(n, 1000)
+        total  += _squares[rest]
+    return total
 
 
 ##### Test functions
 
+def check_factorial(i):
+    '''
+    Check that the non recursive factorial variants give the same value for i
+    Returns a list with the mismatches, for use with parallel_sweep
+    '''
+
+    messages            = []
+    factorial_iter      = factorial_iterative(i)
+    for name, function in [
+            ('factorial_fast',               factorial_fast),
+            ('factorial_tail_recursion',     factorial_tail_recursion),
+            ('factorial_tail_recursion_old', factorial_tail_recursion_old),
+    ]:
+        factorial_other = function(i)
+        if factorial_iter != factorial_other:
+            messages.append('factorial_iterative({0}) not equal {1}({0}):'
+                            '{2}, {3}'.format(i, name, factorial_iter, factorial_other))
+    return messages
+
+def check_fibonacci(i):
+    '''
+    Check that fibonacci iterative, _check_fibonacci_memoize, fast and pair
+    give the same value for i
+    fibonacci_memoize itself is checked in the tests, its unbounded cache
+    does not fit in the workers
+    Returns a list with the mismatches, for use with parallel_sweep
+    '''
+
+    messages        = []
+    fibonacci_iter  = fibonacci_iterative(i)
+    fibonacci_mem   = _check_fibonacci_memoize(i)
+    fibonacci_fst   = fibonacci_fast(i)
+    if fibonacci_iter != fibonacci_mem:
+        messages.append('fibonacci_iterative({0}) not equal _check_fibonacci_memoize({0}):'
+                        '{1}, {2}'.format(i, fibonacci_iter, fibonacci_mem))
+    if fibonacci_iter != fibonacci_fst:
+        messages.append('fibonacci_iterative({0}) not equal fibonacci_fast({0}):'
+                        '{1}, {2}'.format(i, fibonacci_iter, fibonacci_fst))
+    if fibonacci_pair(i - 1)[1] != fibonacci_iter:
+        messages.append('fibonacci_pair({0}) does not end with fibonacci_iterative({1})'.
+                        format(i - 1, i))
+    return messages
+
+# Every worker of parallel_sweep has its own cache: with all values upto
+# 3 * 10 ** 5 cached that would be gigabytes per worker. So the cache is
+# bounded, trampoline makes it work when the lower values are evicted.
+@memoize(maxsize = 1000, trampoline = True)
+def _check_fibonacci_memoize(n):
+    '''fibonacci_memoize with a bounded cache for check_fibonacci'''
+
+    assert n >= 0
+    if (n == 0) or (n == 1):
+        return n
+    else:
+        return _check_fibonacci_memoize(n - 1) + _check_fibonacci_memoize(n - 2)
+
 def time_function(name, n, repeats, notifier, description = '', display = True):
     '''
     Helper function to test the performance of functions
+    Only works for functions of this module with one int argument,
+    for other callables use timeDecebal.time_callable
     '''
 
     if display:
@@ -267,6 +884,7 @@ happy_number_init()
 
 ### Testing should go to its own file
 ### Testing and performance checking (if not part of testing) should be splitted
+### Machine readable performance checking is in benchmarkDecebal.py
 if __name__ == '__main__':
     keywords        = [
         'all',
@@ -337,6 +955,11 @@ if __name__ == '__main__':
         notify.give_msg('Check if the functions give the right value for the first '
                         '{0} values'.format(len(factorial_numbers)))
         for i in range(len(factorial_numbers)):
+            if factorial_fast(i) != factorial_numbers[i]:
+                notify.give_msg('Error calculating factorial_fast({0})'
+                                '{1} instead of {2}'.
+                                format(i, factorial_fast(i), factorial_numbers[i]))
+                error = True
             if factorial_iterative(i) != factorial_numbers[i]:
                 notify.give_msg('Error calculating factorial_iterative({0})'
                                 '{1} instead of {2}'.
@@ -366,12 +989,18 @@ if __name__ == '__main__':
         end     = 985
         notify.give_msg('Check that all version gives the same values for {0} upto {1}'.
                       format(start, end))
-        for i in range(start, end + 1):
+        for i in utilDecebal.Progress(range(start, end + 1), notifier = notify,
+                                      check_every = 10, unit = 'values'):
             factorial_iter      = factorial_iterative(i)
+            factorial_fst       = factorial_fast(i)
             factorial_recur     = factorial_recursive(i)
             factorial_recur_old = factorial_recursive_old(i)
             factorial_tail      = factorial_tail_recursion(i)
             factorial_tail_old  = factorial_tail_recursion_old(i)
+            if factorial_iter != factorial_fst:
+                notify.give_msg('factorial_iterative({0}) not equal factorial_fast({0}):'
+                                '{1}, {2}'.format(i, factorial_iter, factorial_fst))
+                error = True
             if factorial_iter != factorial_recur:
                 notify.give_msg('factorial_iterative({0}) not equal factorial_recursive({0}):'
                                 '{1}, {2}'.format(i, factorial_iter, factorial_recur))
@@ -393,26 +1022,22 @@ if __name__ == '__main__':
         step    = 1000
         notify.give_msg('Check that the non recursive variants give the same value '
                         'from {0} upto {1} step {2}'.format(start, end, step))
-        for i in range(start, end + 1, step):
-            if (i % 10000) == start:
-                notify.give_msg('Currently at %7d' % i)
-            factorial_iter      = factorial_iterative(i)
-            factorial_tail      = factorial_tail_recursion(i)
-            factorial_tail_old  = factorial_tail_recursion_old(i)
-            if factorial_iter != factorial_tail:
-                notify.give_msg('factorial_iterative({0}) not equal factorial_tail_recursion({0}):'
-                                '{1}, {2}'.format(i, factorial_iter, factorial_tail))
-                error = True
-            if factorial_iter != factorial_tail_old:
-                notify.give_msg('factorial_iterative({0}) not equal factorial_tail_recursion_old({0}):'
-                                '{1}, {2}'.format(i, factorial_iter, factorial_tail_old))
-                error = True
+        for message in parallel_sweep(check_factorial, range(start, end + 1, step),
+                                      chunk_size = 5, notifier = notify):
+            notify.give_msg(message)
+            error = True
+        notify.give_msg('Check that factorial_fast with workers gives the same value')
+        if factorial_fast(end, workers = 4) != factorial_fast(end):
+            notify.give_msg('factorial_fast({0}, workers = 4) not equal factorial_fast({0})'.
+                            format(end))
+            error = True
         if not error:
             notify.give_msg('Calculating values OK')
         print('')
         repeats = 100000
         notify.give_msg('Start with the time needed to calculate {0} times'.format(repeats))
         for function in [
+                'factorial_fast              ',
                 'factorial_iterative         ',
                 'factorial_recursive         ',
                 'factorial_recursive_old     ',
@@ -433,15 +1058,22 @@ if __name__ == '__main__':
             end = 5 * 10 ** 5
         for i in range(start, end + 1, step):
             for function in [
+                    'factorial_fast              ',
                     'factorial_iterative         ',
                     'factorial_tail_recursion    ',
                     'factorial_tail_recursion_old',
             ]:
                 time_function(function, i, repeats, notify)
+            notify.give_msg('Timing factorial_fast({0}, workers = 4): '.format(i),
+                            use_newline = False)
+            print('{0:.3E}'.format(timeit(lambda: factorial_fast(i, workers = 4),
+                                          number = repeats)))
             print('')
         notify.give_msg('These result show that tail recursion can be interesting')
         notify.give_msg('They show also that the way you use tail recursion is important',
                         show_time = False)
+        notify.give_msg('But a product tree (factorial_fast) is by far the fastest',
+                        show_time = False)
         print('')
 
     if do_all or do_fibonacci:
@@ -466,12 +1098,22 @@ if __name__ == '__main__':
             if fibonacci_analytic(i) != fibonacci_numbers[i]:
                 notify.give_msg('Error calculating fibonacci_analytic({0})'.format(i))
                 error = True
+            if fibonacci_fast(i) != fibonacci_numbers[i]:
+                notify.give_msg('Error calculating fibonacci_fast({0})'.format(i))
+                error = True
             if fibonacci_memoize(i) != fibonacci_numbers[i]:
                 notify.give_msg('Error calculating fibonacci_memoize({0})'.format(i))
                 error = True
+            if fibonacci_memoize_trampoline(i) != fibonacci_numbers[i]:
+                notify.give_msg('Error calculating fibonacci_memoize_trampoline({0})'.
+                                format(i))
+                error = True
             if fibonacci_old(i) != fibonacci_numbers[i]:
                 notify.give_msg('Error calculating fibonacci_old({0})'.format(i))
                 error = True
+        if fibonacci_batch(range(len(fibonacci_numbers))) != fibonacci_numbers:
+            notify.give_msg('Error calculating fibonacci_batch')
+            error = True
         start   = 39
         end     = 70
         step    = 1
@@ -488,18 +1130,47 @@ if __name__ == '__main__':
         start   = 50
         end     = 3 * 10 ** 5
         step    = 332
-        notify.give_msg('Check that fibonacci iterative and memoize give '
-                        'the same values for {0} upto {1} step {2}'.
+        notify.give_msg('Check that fibonacci iterative, bounded memoize with trampoline '
+                        'and fast give the same values for {0} upto {1} step {2}'.
                         format(start, end, step))
-        for i in range(start, end + 1, step):
-            if (i % (step * 30)) == start:
-                notify.give_msg('Currently at %7d' % i)
-            fibonacci_iter  = fibonacci_iterative(i)
-            fibonacci_mem   = fibonacci_memoize(i)
-            if fibonacci_iter != fibonacci_mem:
-                notify.give_msg('fibonacci_iterative({0}) not equal fibonacci_memoize({0}):'
-                                '{1}, {2}'.format(i, fibonacci_iter, fibonacci_mem))
+        # Every worker needs memory for big fibonacci values, so not to many
+        for message in parallel_sweep(check_fibonacci, range(start, end + 1, step),
+                                      chunk_size = 30, workers = 4, notifier = notify):
+            notify.give_msg(message)
+            error = True
+        n = 2 * 10 ** 4
+        notify.give_msg('Check that fibonacci memoize gives the same values as '
+                        'fibonacci fast upto {0}'.format(n))
+        fibonacci_memoize()
+        fibonacci_memoize.warm(range(n + 1))
+        for i in range(0, n + 1, 97):
+            if fibonacci_memoize(i) != fibonacci_fast(i):
+                notify.give_msg('fibonacci_memoize({0}) not equal fibonacci_fast({0})'.
+                                format(i))
                 error = True
+        fibonacci_memoize()
+        notify.give_msg('Check that fibonacci batch gives the same values as fast '
+                        'for {0} upto {1} step {2}'.format(start, end, step))
+        numbers = list(range(start, end + 1, step))
+        if fibonacci_batch(numbers) != [fibonacci_fast(i) for i in numbers]:
+            notify.give_msg('fibonacci_batch not equal fibonacci_fast')
+            error = True
+        notify.give_msg('Check that fibonacci mod gives the same values as '
+                        'fibonacci fast for several moduli')
+        fibonacci_fst = fibonacci_batch(numbers)
+        for modulus in [1, 2, 10, 997, 10 ** 6, 10 ** 6 + 3]:
+            if fibonacci_mod(numbers, modulus) != [i % modulus for i in fibonacci_fst]:
+                notify.give_msg('fibonacci_mod not correct for modulus {0}'.
+                                format(modulus))
+                error = True
+        n = 10 ** 5
+        notify.give_msg('Check that fibonacci memoize with trampoline works from an '
+                        'empty cache for {0}'.format(n))
+        if fibonacci_memoize_trampoline_after_clearing(n) != fibonacci_fast(n):
+            notify.give_msg('fibonacci_memoize_trampoline({0}) not equal '
+                            'fibonacci_fast({0})'.format(n))
+            error = True
+        fibonacci_memoize_trampoline()
         if not error:
             notify.give_msg('Calculating values OK')
         print('')
@@ -518,6 +1189,9 @@ if __name__ == '__main__':
         for n in range(15, 36, 5):
             time_function('fibonacci_analytic', n, repeats, notify)
         print('')
+        for n in range(15, 36, 5):
+            time_function('fibonacci_fast', n, repeats, notify)
+        print('')
         for n in range(310, 331, 5):
             time_function('fibonacci_memoize_after_clearing', n, repeats, notify,
                           'fibonacci_memoize')
@@ -528,6 +1202,30 @@ if __name__ == '__main__':
         for n in range(310, 331, 5):
             time_function('fibonacci_analytic', n, repeats, notify)
         print('')
+        for n in range(310, 331, 5):
+            time_function('fibonacci_fast', n, repeats, notify)
+        print('')
+        # Above 332 fibonacci_memoize needs precomputing or trampoline
+        n = 10 ** 4
+        fibonacci_memoize()
+        notify.give_msg('Timing precomputing fibonacci_memoize upto {0}: '.format(n),
+                        use_newline = False)
+        print('{0:.3E}'.format(timeit(lambda: fibonacci_memoize.warm(range(n + 1)),
+                                      number = 1)))
+        notify.give_msg('Timing fibonacci_memoize({0}) after precomputing: '.format(n),
+                        use_newline = False)
+        print('{0:.3E}'.format(timeit(lambda: fibonacci_memoize(n), number = repeats)))
+        time_function('fibonacci_memoize_trampoline_after_clearing', n, repeats, notify,
+                      'fibonacci_memoize_trampoline')
+        fibonacci_memoize()
+        fibonacci_memoize_trampoline()
+        print('')
+        repeats = 1
+        notify.give_msg('Start with the time needed to calculate {0} times'.format(repeats))
+        for n in range(10 ** 6, 5 * 10 ** 6 + 1, 10 ** 6):
+            time_function('fibonacci_iterative', n, repeats, notify)
+            time_function('fibonacci_fast     ', n, repeats, notify)
+        print('')
 
         for large_fibonacci in range(20, 41, 5):
             notify.give_msg(
@@ -599,7 +1297,10 @@ if __name__ == '__main__':
         notify.give_msg('fibonacci_iterative(500):', show_time = False)
         notify.give_msg('{0}'.format(fibonacci_iterative(500)),
                         show_time = False)
-        notify.give_msg('That is why fibonacci calls fibonacci_iterative.',
+        notify.give_msg('For big numbers fibonacci_fast is a lot faster, because it only',
+                        show_time = False)
+        notify.give_msg('needs O(log n) multiplications.', show_time = False)
+        notify.give_msg('That is why fibonacci calls fibonacci_fast.',
                         show_time = False)
         print('')
 
@@ -623,14 +1324,32 @@ if __name__ == '__main__':
             921, 923, 931, 932, 937, 940, 946, 964, 970, 973,
             989, 998, 1000
         ]
-        if happy_numbers_list(1000) == happy_numbers:
-            notify.give_msg('Happy numbers OK')
-        else:
+        error = False
+        if happy_numbers_list(1000) != happy_numbers:
             notify.give_msg('ERROR in happy list')
             error = True
+        for i in range(1, 1001):
+            expected = len([j for j in happy_numbers if j <= i])
+            if happy_numbers_count(i) != expected:
+                notify.give_msg('happy_numbers_count({0}) gives {1} instead of {2}'.
+                                format(i, happy_numbers_count(i), expected))
+                error = True
+        for count in [12345, 10 ** 5, 987654]:
+            if happy_numbers_count(count) != happy_numbers_count_old(count):
+                notify.give_msg('happy_numbers_count({0}) not equal happy_numbers_count_old({0})'.
+                                format(count))
+                error = True
+        if not error:
+            notify.give_msg('Happy numbers OK')
         print('')
         count = 10 ** 8
         time_function('happy_numbers_list', count, 1, notify)
+        time_function('happy_numbers_count_old', count, 1, notify)
+        for k in range(2, 19, 4):
+            time_function('happy_numbers_count', 10 ** k, 1, notify)
+        notify.give_msg('Calculating happy_numbers_count({0})'.format(count))
+        notify.give_msg(str(happy_numbers_count(count)))
+        count = 10 ** 18
         notify.give_msg('Calculating happy_numbers_count({0})'.format(count))
         notify.give_msg(str(happy_numbers_count(count)))
         print('')
@@ -659,11 +1378,33 @@ if __name__ == '__main__':
         if lucky_numbers(lucky_numbers_list[-1]) != lucky_numbers_list:
             notify.give_msg('ERROR in lucky list')
             error = True
+        if lucky_numbers_old(lucky_numbers_list[-1]) != lucky_numbers_list:
+            notify.give_msg('ERROR in lucky list old')
+            error = True
+        for count in [1, 2, 3, 4, 12345, 10 ** 6, 3 * 10 ** 6 + 1]:
+            if lucky_numbers(count) != lucky_numbers_old(count):
+                notify.give_msg('lucky_numbers({0}) not equal lucky_numbers_old({0})'.
+                                format(count))
+                error = True
+            if lucky_numbers_count(count) != len(lucky_numbers_old(count)):
+                notify.give_msg('lucky_numbers_count({0}) not equal the length of '
+                                'lucky_numbers_old({0})'.format(count))
+                error = True
+        lucky_set = set(lucky_numbers_list)
+        for i in range(1, lucky_numbers_list[-1] + 1):
+            if is_lucky(i) != (i in lucky_set):
+                notify.give_msg('is_lucky({0}) gives {1}'.format(i, is_lucky(i)))
+                error = True
         if not error:
             notify.give_msg('lucky_numbers OK')
         print('')
+        count = 10 ** 7
+        time_function('lucky_numbers_old', count, 1, notify)
+        time_function('lucky_numbers    ', count, 1, notify)
         count = 5 * 10 ** 7
         time_function('lucky_numbers', count, 1, notify)
+        time_function('lucky_numbers_count', count, 1, notify)
+        time_function('is_lucky', count - 1, 1, notify)
         notify.give_msg('Calculating lucky_numbers_count({0})'.format(count))
         notify.give_msg(str(lucky_numbers_count(count)))
         print('')
@@ -1,8 +1,19 @@
-from __future__ import print_function
+from __future__ import division, print_function
 
 import gc
+import math
 import timeit
 
+from collections            import namedtuple
+
+# Python 2 has no concurrent.futures (without the futures backport) and no
+# get_context, they are only needed for isolate
+try:
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing    import get_context
+except ImportError:
+    ProcessPoolExecutor = get_context = None
+
 
 ##### Classes
 
@@ -56,8 +67,71 @@ class Timer:
         self.verbose    = verbose
 
 
+# Result of time_callable, all times are per call
+TimingStats = namedtuple('TimingStats', ['best', 'mean', 'stdev', 'loops', 'repeats'])
+
+
 ##### Functions
 
+def time_callable(function, args = (), kwargs = None, repeats = 5, loops = None,
+                  isolate = False):
+    '''
+    Time function(*args, **kwargs) with timeit.
+    When loops is None the number of loops per repeat is determined with
+    timeit's autorange, so a repeat takes at least 0.2 seconds.
+    With isolate = True every measurement is done in a fresh Python process,
+    so caches filled by one measurement (like memoize) do not influence the
+    next one. The function and arguments then need to be picklable.
+    Returns a TimingStats with the best, mean and standard deviation of the
+    time per call, the loops and the repeats.
+    '''
+
+    if repeats < 1:
+        raise ValueError('You should time at least once')
+    if (loops is not None) and (loops < 1):
+        raise ValueError('You should loop at least once')
+    if isolate and (get_context is None):
+        raise ImportError('isolate needs concurrent.futures and multiprocessing.get_context')
+    if kwargs is None:
+        kwargs = {}
+    if isolate:
+        def measure(loops):
+            context = get_context('spawn')
+            with ProcessPoolExecutor(max_workers = 1, mp_context = context) as executor:
+                return executor.submit(_time_loops, function, args, kwargs, loops).result()
+    else:
+        def measure(loops):
+            return _time_loops(function, args, kwargs, loops)
+
+    if loops is None:
+        loops = measure(None)[0]
+    times   = [measure(loops)[1] / loops for i in range(repeats)]
+    mean    = sum(times) / repeats
+    if repeats > 1:
+        stdev = math.sqrt(sum((t - mean) ** 2 for t in times) / (repeats - 1))
+    else:
+        stdev = 0.0
+    return TimingStats(min(times), mean, stdev, loops, repeats)
+
+def _time_loops(function, args, kwargs, loops):
+    '''
+    Returns (loops, used time) for calling function loops times
+    When loops is None it is determined with autorange
+    '''
+
+    timer = timeit.Timer(lambda: function(*args, **kwargs))
+    if loops is not None:
+        return loops, timer.timeit(loops)
+    # Python 2 does not have autorange
+    if hasattr(timer, 'autorange'):
+        return timer.autorange()
+    loops = 1
+    while True:
+        used_time = timer.timeit(loops)
+        if used_time >= 0.2:
+            return loops, used_time
+        loops *= 10
+
 def time_test(function, arguments, print_time = True):
     '''
     Sometimes you want the time used of a function AND the output of the function.
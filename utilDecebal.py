@@ -3,36 +3,410 @@
 
 from __future__     import division, print_function
 
+import atexit
 import functools
+import io
 import json
 import marshal
+import math
+import mmap
+import operator
 import os
 import pickle
+import random
 import re
 import sys
+import threading
 
+from array                      import array
+from collections                import OrderedDict, deque, namedtuple
+from heapq                      import heapify, heappop, heappush
 from os.path                    import expanduser
+from six.moves                  import queue
 from six.moves.urllib.request   import urlopen
-from time                       import sleep, strftime, time
+from time                       import localtime, sleep, strftime, time
+
+# NumPy is optional, it is only used to speed things up
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# sortedcontainers is optional, without it MovingQuantile uses two heaps
+try:
+    from sortedcontainers import SortedList
+except ImportError:
+    SortedList = None
+# Python 2 has no concurrent.futures (without the futures backport), no
+# asyncio and no monotonic
+try:
+    from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+except ImportError:
+    Future = ProcessPoolExecutor = as_completed = None
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+try:
+    from time import monotonic
+except ImportError:
+    monotonic = time
+# For locking the persistent memoize file, only available on POSIX
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 ##### Exception Classes
 
+# Raised by a trampolined memoized function for a value it needs first
+class _MemoizeDeferred(Exception):
+    def __init__(self, args, kwargs):
+        Exception.__init__(self, args, kwargs)
+        self.call = (args, kwargs)
+
 class SerializationError(Exception):
     pass
 
 
 ##### Classes
 
+# Statistics of a memoized function, bytes is None without byte accounting
+CacheInfo = namedtuple('CacheInfo',
+                       ['hits', 'misses', 'evictions', 'maxsize', 'currsize', 'bytes'])
+
+class _LazyHeap(object):
+    '''
+    Heap from which every value in it can be removed
+    A removed value is only counted and dropped when it comes on top, when
+    more as half of the heap are removed values the heap is rebuilt.
+    With largest the largest value is on top (the values are negated).
+    '''
+
+    __slots__ = ('_heap', '_removed', '_sign', '_size')
+
+    def pop(self):
+        '''Remove the top value and return it'''
+
+        value       = self._sign * heappop(self._heap)
+        self._size -= 1
+        self._clean()
+        return value
+
+    def push(self, value):
+        '''Add value'''
+
+        heappush(self._heap, self._sign * value)
+        self._size += 1
+
+    def remove(self, value):
+        '''Remove value, which has to be in the heap'''
+
+        self._removed[value] = self._removed.get(value, 0) + 1
+        self._size -= 1
+        if len(self._heap) > 2 * self._size + 16:
+            self._rebuild()
+        else:
+            self._clean()
+
+    def top(self):
+        '''Return the top value'''
+
+        return self._sign * self._heap[0]
+
+    def _clean(self):
+        '''Drop the removed values on top'''
+
+        heap    = self._heap
+        removed = self._removed
+        while heap and (self._sign * heap[0] in removed):
+            value = self._sign * heappop(heap)
+            if removed[value] == 1:
+                del removed[value]
+            else:
+                removed[value] -= 1
+
+    def _rebuild(self):
+        '''Rebuild the heap without the removed values'''
+
+        removed = self._removed
+        heap    = []
+        for stored in self._heap:
+            value = self._sign * stored
+            if value in removed:
+                if removed[value] == 1:
+                    del removed[value]
+                else:
+                    removed[value] -= 1
+            else:
+                heap.append(stored)
+        heapify(heap)
+        self._heap = heap
+
+    def __len__(self):
+        return self._size
+
+    def __init__(self, largest = False):
+        '''Initialise the class'''
+
+        self._heap      = []
+        self._removed   = {}
+        self._sign      = -1 if largest else 1
+        self._size      = 0
+
+# Needs object in Python 2, pickle ignores __reduce__ of a classic instance
+class _MemoizeMark(object):
+    '''
+    Separates args and kwargs in a key of memoize
+    It is pickled by name, so keys stay equal in other processes
+    '''
+
+    def __reduce__(self):
+        return '_memoize_mark'
+
+class _MemoizePersist:
+    '''
+    The persistent tier of memoize: an append-only file with the results
+    Every record is a (key, value) tuple dumped with format (pickle or
+    marshal; marshal is faster, but does not support keyword arguments).
+    New results are written in batches of batch records; flush writes the
+    rest and is also called at exit.
+    When there is a miss, the records that were written (also by other
+    processes) since the last read are loaded first, so the file is read
+    lazily.
+    On POSIX the file is locked while reading and writing, so several
+    processes can share it. A record that is not complete (for example
+    after a crash) ends the reading.
+    '''
+
+    def append(self, key, value):
+        '''Add a result, it is written when the batch is full'''
+
+        self._pending.append(self._format.dumps((key, value)))
+        if len(self._pending) >= self._batch:
+            self.flush()
+
+    def flush(self):
+        '''Write the results that are not written yet'''
+
+        if not self._pending:
+            return
+        data            = b''.join(self._pending)
+        self._pending   = []
+        with open(self._filename, 'ab') as out_f:
+            _lock_file(out_f, True)
+            try:
+                out_f.seek(0, os.SEEK_END)
+                end = out_f.tell()
+                out_f.write(data)
+                out_f.flush()
+                # When nothing was added by others, there is no need to read it
+                if end == self._offset:
+                    self._offset = end + len(data)
+            finally:
+                _unlock_file(out_f)
+
+    def load(self, store):
+        '''
+        Add the records written since the last load to store
+        Returns True when something was added
+        '''
+
+        try:
+            if os.path.getsize(self._filename) <= self._offset:
+                return False
+        except OSError:
+            return False
+        with open(self._filename, 'rb') as in_f:
+            _lock_file(in_f, False)
+            try:
+                in_f.seek(self._offset)
+                data = in_f.read()
+            finally:
+                _unlock_file(in_f)
+        stream      = io.BytesIO(data)
+        consumed    = 0
+        while consumed < len(data):
+            try:
+                key, value = self._format.load(stream)
+            except (EOFError, TypeError, ValueError, pickle.UnpicklingError):
+                break
+            store.add(key, value)
+            consumed = stream.tell()
+        self._offset += consumed
+        return consumed > 0
+
+    def reset(self):
+        '''Write the pending results and read the file again on the next load'''
+
+        self.flush()
+        self._offset = 0
+
+    def __init__(self, filename, format = pickle, batch = 100):
+        '''Initialise the class'''
+
+        if batch < 1:
+            raise ValueError('batch should be at least 1')
+        self._filename  = expanduser(filename)
+        self._format    = format
+        self._batch     = batch
+        self._offset    = 0
+        self._pending   = []
+        directory       = os.path.dirname(self._filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        atexit.register(self.flush)
+
+class _MemoizeStore:
+    '''
+    The cache of memoize
+    It can be bounded by the number of values (maxsize) and/or by the
+    size in bytes of the values (max_bytes, measured with sys.getsizeof).
+    When it is full a value is evicted with the policy:
+    - lru: least recently used
+    - lfu: least frequently used (of those the least recently used)
+    With ttl a value expires ttl seconds after it was cached.
+    memoize looks up values itself, so values is never replaced
+    '''
+
+    def add(self, key, value):
+        '''Cache value for key, evicting values when needed'''
+
+        if key in self.values:
+            self._remove(key)
+        if self._max_bytes is not None:
+            size = sys.getsizeof(value)
+            # A value that does not fit at all is not cached
+            if size > self._max_bytes:
+                return
+            while self.values and (self._total_bytes + size > self._max_bytes):
+                self._evict()
+            self._sizes[key]     = size
+            self._total_bytes   += size
+        if self._maxsize is not None:
+            while len(self.values) >= self._maxsize:
+                self._evict()
+        self.values[key] = value
+        if self._lfu:
+            self._counts[key]   = 1
+            self._buckets.setdefault(1, OrderedDict())[key] = None
+            self._min_count     = 1
+        if self._ttl is not None:
+            self._expires[key]  = monotonic() + self._ttl
+
+    def clear(self):
+        '''Empty the cache, the statistics are also reset'''
+
+        self.values.clear()
+        self._counts.clear()
+        self._buckets.clear()
+        self._sizes.clear()
+        self._expires.clear()
+        self._min_count     = 0
+        self._total_bytes   = 0
+        self.hits           = 0
+        self.misses         = 0
+        self.evictions      = 0
+
+    def expired(self, key):
+        '''Check if the value of key is expired, if so it is removed'''
+
+        if self._expires[key] > monotonic():
+            return False
+        self._remove(key)
+        return True
+
+    def hit(self, key):
+        '''Register that the value of key was used'''
+
+        self.hits += 1
+        if self._lfu:
+            count   = self._counts[key]
+            bucket  = self._buckets[count]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[count]
+                if self._min_count == count:
+                    self._min_count = count + 1
+            self._counts[key] = count + 1
+            self._buckets.setdefault(count + 1, OrderedDict())[key] = None
+        elif self.bounded:
+            # Python 2 does not have move_to_end
+            self.values[key] = self.values.pop(key)
+
+    def info(self):
+        '''Return the statistics as a CacheInfo'''
+
+        return CacheInfo(self.hits, self.misses, self.evictions, self._maxsize,
+                         len(self.values),
+                         None if self._max_bytes is None else self._total_bytes)
+
+    def put(self, key, value):
+        '''Cache value for key after a miss'''
+
+        self.misses += 1
+        self.add(key, value)
+
+    def _evict(self):
+        '''Remove one value with the eviction policy'''
+
+        if self._lfu:
+            key = next(iter(self._buckets[self._min_count]))
+        else:
+            key = next(iter(self.values))
+        self._remove(key)
+        self.evictions += 1
+
+    def _remove(self, key):
+        '''Remove the value of key'''
+
+        del self.values[key]
+        if self._lfu:
+            count   = self._counts.pop(key)
+            bucket  = self._buckets[count]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[count]
+                if self._min_count == count:
+                    self._min_count = min(self._buckets) if self._buckets else 0
+        if self._max_bytes is not None:
+            self._total_bytes -= self._sizes.pop(key)
+        self._expires.pop(key, None)
+
+    def __init__(self, maxsize = None, policy = 'lru', max_bytes = None, ttl = None):
+        '''Initialise the class'''
+
+        if (maxsize is not None) and (maxsize < 1):
+            raise ValueError('maxsize should be at least 1')
+        if (max_bytes is not None) and (max_bytes < 1):
+            raise ValueError('max_bytes should be at least 1')
+        if policy not in ('lru', 'lfu'):
+            raise ValueError('policy should be lru or lfu')
+        if (ttl is not None) and (ttl <= 0):
+            raise ValueError('ttl should be positive')
+        self._maxsize   = maxsize
+        self._max_bytes = max_bytes
+        self._lfu       = policy == 'lfu'
+        self._ttl       = ttl
+        self.bounded    = (maxsize is not None) or (max_bytes is not None)
+        # The order is only needed for lru eviction
+        self.values     = OrderedDict() if self.bounded and not self._lfu else {}
+        self._counts    = {}
+        self._buckets   = {}
+        self._sizes     = {}
+        self._expires   = {}
+        self.clear()
+
 ### Improvements
-### Create a next_values
 ### Create a internal checking function
-### Implement no_rolling_sum
 ### Expand testing
-### Option to force no_rolling_sum when no_rolling_sum is False
-### - for the current call
-### - for the current call and length -1 following
-class MovingAverage:
+### Option to force resum for the current call and length - 1 following
+# Types accepted by MovingAverage, in a tuple so it is one isinstance call
+_moving_average_types   = (int, float)
+_infinity               = float('inf')
+
+# Needs object in Python 2 for __slots__
+class MovingAverage(object):
     '''
     http://en.wikipedia.org/wiki/Moving_average
 
@@ -42,81 +416,791 @@ class MovingAverage:
     are ate least LENGTH values. My implementation gives always a result.
     You can always ignore the first LENGTH - 1 values.
 
+    The values are kept in a ring buffer, so every next value takes the
+    same (small) time, also for a big length.
+
+    The rolling total drifts over many values by rounding errors. With
+    precise the total is kept with Neumaier compensated summation and every
+    resum_every (default length) values it is summed again exactly with
+    math.fsum. resum_every = 1 does not use a rolling total at all.
+    resum() sums again at once.
+
+    A MovingAverage can be pickled and with seed it can start in the middle
+    of a series, see moving_average_file.
+
     An extension would be to accept all numeric types.
     '''
 
+    __slots__ = ('_compensation', '_count', '_current_total', '_length', '_old_values',
+                 '_position', '_precise', '_resum_every', '_since_resum')
+
+    def _add_compensated(self, value):
+        '''Add value to the total with Neumaier summation'''
+
+        total   = self._current_total
+        new     = total + value
+        if abs(total) >= abs(value):
+            self._compensation += (total - new) + value
+        else:
+            self._compensation += (value - new) + total
+        self._current_total = new
+
     def current_value(self):
         '''Return current value, None if no current value'''
 
-        if len(self._old_values) == 0:
+        if self._count == 0:
             return None
         return self._return_value()
 
     def next_value(self, next):
         '''Calculate next value and return it'''
 
-        if not (isinstance(next, int) or isinstance(next, float)):
+        if not isinstance(next, _moving_average_types):
             raise TypeError('Parameter has to be (subclasss of) float or int')
+        if self._precise:
+            return self._next_value_precise(next)
+        position             = self._position
         self._current_total += next
-        self._old_values.append(next)
-        if len(self._old_values) > self._length:
-            self._current_total -= self._old_values.pop(0)
+        if self._count == self._length:
+            self._current_total -= self._old_values[position]
+        else:
+            self._count += 1
+        self._old_values[position] = next
+        position += 1
+        self._position = 0 if position == self._length else position
         return self._return_value()
 
+    def _next_value_precise(self, next):
+        '''next_value with compensated summation and resumming'''
+
+        position = self._position
+        if self._count == self._length:
+            old = self._old_values[position]
+        else:
+            old = 0.0
+            self._count += 1
+        self._old_values[position] = next
+        position += 1
+        self._position      = 0 if position == self._length else position
+        self._since_resum  += 1
+        if self._since_resum >= self._resum_every:
+            self.resum()
+        else:
+            self._add_compensated(next)
+            self._add_compensated(-old)
+        return self._return_value()
+
+    def next_values(self, values):
+        '''
+        Calculate the next value for all values and return them as an array
+        The results are the same as calling next_value for every value
+        With NumPy a NumPy array is returned, otherwise an array('d'). With
+        NumPy the values are calculated at once, except in precise mode
+        '''
+
+        if (numpy is not None) and not self._precise:
+            if not isinstance(values, numpy.ndarray):
+                values = list(values)
+            block = numpy.asarray(values)
+            # Other types are done one by one, so the TypeError is the same
+            if (block.ndim == 1) and (block.dtype.kind in 'biuf'):
+                return self._next_values_numpy(block.astype(float))
+        next_value  = self.next_value
+        result      = array('d')
+        for value in values:
+            result.append(next_value(value))
+        if numpy is not None:
+            return numpy.array(result)
+        return result
+
+    def _next_values_numpy(self, block):
+        '''
+        next_values for a float NumPy array, the totals are from
+        _moving_totals so they round the same as with next_value
+        '''
+
+        length  = self._length
+        count   = self._count
+        n       = len(block)
+        if n == 0:
+            return numpy.empty(0)
+        ring    = numpy.frombuffer(self._old_values, dtype = float)
+        totals, series = _moving_totals(ring, count, self._position,
+                                        self._current_total, block)
+        counts      = numpy.minimum(numpy.arange(count + 1, count + n + 1), length)
+        overflow    = numpy.flatnonzero(numpy.isinf(totals))
+        # Like next_value the values upto the overflow are used
+        last        = overflow[0] + 1 if len(overflow) else n
+        tail        = series[max(0, count + last - length):count + last]
+        ring[:len(tail)]    = tail
+        self._count         = len(tail)
+        self._position      = len(tail) % length
+        self._current_total = float(totals[last - 1])
+        if len(overflow):
+            raise OverflowError(
+                "Can not give a value because there was an overflow")
+        return totals / counts
+
+    def resum(self):
+        '''Sum the values again exactly, this removes the drift'''
+
+        # The unused part of the ring buffer is 0.0
+        self._current_total = math.fsum(self._old_values)
+        self._compensation  = 0.0
+        self._since_resum   = 0
+
     def _return_value(self):
         '''Return current value'''
 
-        if (self._current_total == float("inf")) or \
-           (self._current_total == float("-inf")):
+        if abs(self._current_total) == _infinity:
             raise OverflowError(
                 "Can not give a value because there was an overflow")
-        return self._current_total / len(self._old_values)
+        if self._precise:
+            return (self._current_total + self._compensation) / self._count
+        return self._current_total / self._count
 
-    def __init__(self, length):
+    def seed(self, values):
+        '''
+        Start again with values as the values that came before, for example
+        to start in the middle of a series
+        Only the last length values are used
+        '''
+
+        self._old_values        = array('d', [0.0]) * self._length
+        self._count             = 0
+        self._position          = 0
+        self._current_total     = 0.0
+        self._compensation      = 0.0
+        self._since_resum       = 0
+        values = values[-self._length:] if hasattr(values, '__getitem__') \
+                 else list(values)[-self._length:]
+        if len(values):
+            self.next_values(values)
+
+    def __getstate__(self):
+        '''Return the state, so a MovingAverage can be pickled (with __slots__)'''
+
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        '''Restore the state given by __getstate__'''
+
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __init__(self, length, precise = False, resum_every = None):
         '''Initialise the class'''
 
         if not isinstance(length, int):
             raise TypeError("Length should be integral")
         if length < 2:
             raise ValueError('Parameter should be greater or equal 2')
+        if (resum_every is not None) and not precise:
+            raise ValueError('resum_every can only be used with precise')
+        if (resum_every is not None) and (resum_every < 1):
+            raise ValueError('resum_every should be at least 1')
         self._length            = length
-        self._old_values        = []
+        self._precise           = precise
+        self._resum_every       = length if resum_every is None else resum_every
+        self._since_resum       = 0
+        self._compensation      = 0.0
+        # Ring buffer with the last length values, _position is the oldest
+        self._old_values        = array('d', [0.0]) * length
+        self._count             = 0
+        self._position          = 0
         self._current_total     = 0.0
 
-### Have the possibility to give the stream instead of using stdout
+# Relative time of a round and of a series on its own in MovingAverageBank.update
+_bank_round_cost    = 5
+_bank_series_cost   = 2
+
+class MovingAverageBank(object):
+    '''
+    MovingAverage for many series at once
+    All windows are kept in one ring buffer of n_series rows of length
+    values (a NumPy array, without NumPy an array('d')), instead of a
+    MovingAverage object for every series. The results are the same as
+    with a MovingAverage for every series.
+    '''
+
+    __slots__ = ('_counts', '_length', '_n_series', '_positions', '_ring', '_totals')
+
+    def current_values(self, series_ids = None):
+        '''
+        Return the current values of series_ids (default all series),
+        nan for a series without values
+        '''
+
+        if series_ids is None:
+            series_ids = range(self._n_series)
+        if numpy is None:
+            return array('d', [self._totals[i] / self._counts[i] if self._counts[i]
+                               else float('nan') for i in series_ids])
+        series_ids = self._check_ids(series_ids)
+        counts     = self._counts[series_ids]
+        with numpy.errstate(invalid = 'ignore'):
+            return self._totals[series_ids] / counts
+
+    def update(self, series_ids, values):
+        '''
+        Give the next value of series series_ids[i] with values[i] and
+        return the current values after every update
+        A series can be more as once in series_ids, its values are then
+        used in the given order
+        '''
+
+        if len(series_ids) != len(values):
+            raise ValueError('series_ids and values should have the same length')
+        if numpy is None:
+            return self._update_python(series_ids, values)
+        series_ids  = self._check_ids(series_ids)
+        values      = numpy.asarray(values)
+        if (values.ndim != 1) or (values.dtype.kind not in 'biuf'):
+            raise TypeError('Values have to be (subclasss of) float or int')
+        values      = values.astype(float)
+        result      = numpy.empty(len(values))
+        if len(values) == 0:
+            return result
+        # The values of a series stay in the given order: the index is part
+        # of the key, which is faster as a stable sort
+        order       = numpy.argsort(series_ids * len(values) + numpy.arange(len(values)))
+        ordered     = series_ids[order]
+        starts      = numpy.flatnonzero(numpy.r_[True, ordered[1:] != ordered[:-1]])
+        sizes       = numpy.diff(numpy.r_[starts, len(ordered)])
+        # A series with many values is done on its own like
+        # MovingAverage.next_values, the other series in rounds which have
+        # every series at most once. The number of rounds is chosen to
+        # minimise the NumPy calls: heavy[k] series on their own need
+        # by_size[k] rounds for the rest.
+        by_size     = numpy.sort(sizes)[::-1]
+        heavy       = numpy.argmin(_bank_round_cost * numpy.r_[by_size, 0] +
+                                   _bank_series_cost * numpy.arange(len(sizes) + 1))
+        rounds      = by_size[heavy] if heavy < len(sizes) else 0
+        overflow    = False
+        for start, size in zip(starts[sizes > rounds], sizes[sizes > rounds]):
+            selected    = order[start:start + size]
+            overflow    = self._update_series(ordered[start], values[selected],
+                                              result, selected) or overflow
+        starts      = starts[sizes <= rounds]
+        sizes       = sizes[sizes <= rounds]
+        ring        = self._ring.reshape(-1)
+        for current in range(rounds):
+            if current:
+                starts  = starts[sizes > current]
+                sizes   = sizes[sizes > current]
+            selected    = order[starts + current]
+            ids         = ordered[starts]
+            positions   = self._positions[ids]
+            # Index in the flat ring buffer
+            indexes     = ids * self._length + positions
+            totals      = self._totals[ids] + values[selected]
+            full        = self._counts[ids] == self._length
+            totals[full]       -= ring[indexes[full]]
+            self._totals[ids]   = totals
+            self._counts[ids]  += ~full
+            ring[indexes]       = values[selected]
+            positions          += 1
+            positions[positions == self._length] = 0
+            self._positions[ids] = positions
+            result[selected]    = totals / self._counts[ids]
+            overflow            = overflow or numpy.isinf(totals).any()
+        if overflow:
+            raise OverflowError(
+                "Can not give a value because there was an overflow")
+        return result
+
+    def _check_ids(self, series_ids):
+        '''Return series_ids as a NumPy array, checking the values'''
+
+        series_ids = numpy.asarray(series_ids, dtype = numpy.intp)
+        if len(series_ids) and ((series_ids.min() < 0) or
+                                (series_ids.max() >= self._n_series)):
+            raise IndexError('Series ids should be between 0 and {0}'.
+                             format(self._n_series - 1))
+        return series_ids
+
+    def _update_python(self, series_ids, values):
+        '''update without NumPy'''
+
+        length  = self._length
+        result  = array('d')
+        for series, value in zip(series_ids, values):
+            if not isinstance(value, _moving_average_types):
+                raise TypeError('Parameter has to be (subclasss of) float or int')
+            if not 0 <= series < self._n_series:
+                raise IndexError('Series ids should be between 0 and {0}'.
+                                 format(self._n_series - 1))
+            position                = self._positions[series]
+            index                   = series * length + position
+            self._totals[series]   += value
+            if self._counts[series] == length:
+                self._totals[series] -= self._ring[index]
+            else:
+                self._counts[series] += 1
+            self._ring[index]           = value
+            self._positions[series]     = (position + 1) % length
+            if abs(self._totals[series]) == _infinity:
+                raise OverflowError(
+                    "Can not give a value because there was an overflow")
+            result.append(self._totals[series] / self._counts[series])
+        return result
+
+
+    def _update_series(self, series, block, result, selected):
+        '''
+        update for the values block of one series, the current values are put
+        in result[selected]
+        Return if there was an overflow
+        '''
+
+        count   = int(self._counts[series])
+        totals, values = _moving_totals(self._ring[series], count,
+                                        int(self._positions[series]),
+                                        self._totals[series], block)
+        tail    = values[-self._length:]
+        self._ring[series, :len(tail)] = tail
+        self._counts[series]    = len(tail)
+        self._positions[series] = len(tail) % self._length
+        self._totals[series]    = totals[-1]
+        result[selected]        = totals / numpy.minimum(
+            numpy.arange(count + 1, count + len(block) + 1), self._length)
+        return numpy.isinf(totals).any()
+
+    def __init__(self, length, n_series):
+        '''Initialise the class'''
+
+        if not (isinstance(length, int) and isinstance(n_series, int)):
+            raise TypeError("Length and n_series should be integral")
+        if length < 2:
+            raise ValueError('Parameter should be greater or equal 2')
+        if n_series < 1:
+            raise ValueError('n_series should be at least 1')
+        self._length    = length
+        self._n_series  = n_series
+        if numpy is None:
+            self._ring      = array('d', [0.0]) * (length * n_series)
+            self._counts    = [0] * n_series
+            self._positions = [0] * n_series
+            self._totals    = [0.0] * n_series
+        else:
+            self._ring      = numpy.zeros((n_series, length))
+            self._counts    = numpy.zeros(n_series, dtype = numpy.intp)
+            self._positions = numpy.zeros(n_series, dtype = numpy.intp)
+            self._totals    = numpy.zeros(n_series)
+
+class _MovingExtreme(object):
+    '''
+    Base of MovingMaximum and MovingMinimum
+    The window is a monotonic deque: a value that can not become the
+    extreme anymore is dropped, so next_value is amortized O(1)
+    '''
+
+    __slots__ = ('_count', '_indexes', '_length', '_values')
+
+    def current_value(self):
+        '''Return current value, None if no current value'''
+
+        if not self._values:
+            return None
+        return self._values[0]
+
+    def next_value(self, next):
+        '''Calculate next value and return it'''
+
+        if not isinstance(next, _moving_average_types):
+            raise TypeError('Parameter has to be (subclasss of) float or int')
+        values      = self._values
+        indexes     = self._indexes
+        dominated   = self._dominated
+        while values and dominated(values[-1], next):
+            values.pop()
+            indexes.pop()
+        values.append(next)
+        indexes.append(self._count)
+        self._count += 1
+        if indexes[0] < self._count - self._length:
+            values.popleft()
+            indexes.popleft()
+        return values[0]
+
+    def __init__(self, length):
+        '''Initialise the class'''
+
+        if not isinstance(length, int):
+            raise TypeError("Length should be integral")
+        if length < 2:
+            raise ValueError('Parameter should be greater or equal 2')
+        self._length    = length
+        self._count     = 0
+        self._indexes   = deque()
+        self._values    = deque()
+
+class MovingMaximum(_MovingExtreme):
+    '''
+    Maximum of the last length values, with the same interface as
+    MovingAverage
+    '''
+
+    __slots__   = ()
+    _dominated  = operator.le
+
+class MovingMinimum(_MovingExtreme):
+    '''
+    Minimum of the last length values, with the same interface as
+    MovingAverage
+    '''
+
+    __slots__   = ()
+    _dominated  = operator.ge
+
+class MovingQuantile(object):
+    '''
+    Quantile of the last length values, with the same interface as
+    MovingAverage
+    Between two values it is interpolated linearly (like NumPy does).
+    With sortedcontainers the window is also kept sorted, otherwise the
+    values upto the quantile are kept in a heap with the largest on top and
+    the others in a heap with the smallest on top. Both make next_value
+    O(log length).
+    '''
+
+    __slots__ = ('_high', '_length', '_low', '_quantile', '_sorted', '_window')
+
+    def current_value(self):
+        '''Return current value, None if no current value'''
+
+        if not self._window:
+            return None
+        return self._return_value()
+
+    def next_value(self, next):
+        '''Calculate next value and return it'''
+
+        if not isinstance(next, _moving_average_types):
+            raise TypeError('Parameter has to be (subclasss of) float or int')
+        window  = self._window
+        ordered = self._sorted
+        low     = self._low
+        high    = self._high
+        if len(window) == self._length:
+            old = window.popleft()
+            if ordered is None:
+                if old <= low.top():
+                    low.remove(old)
+                else:
+                    high.remove(old)
+            else:
+                ordered.remove(old)
+        window.append(next)
+        if ordered is None:
+            if low and (next <= low.top()):
+                low.push(next)
+            else:
+                high.push(next)
+            # The top of low should be the value with rank _rank
+            wanted = self._rank(len(window)) + 1
+            while len(low) > wanted:
+                high.push(low.pop())
+            while len(low) < wanted:
+                low.push(high.pop())
+        else:
+            ordered.add(next)
+        return self._return_value()
+
+    def _neighbours(self):
+        '''
+        Return the value with rank _rank and the value after it (None if
+        there is none)
+        '''
+
+        if self._sorted is None:
+            return self._low.top(), self._high.top() if self._high else None
+        ordered = self._sorted
+        rank    = self._rank(len(ordered))
+        return ordered[rank], ordered[rank + 1] if rank + 1 < len(ordered) else None
+
+    def _rank(self, size):
+        '''Rank of the lowest value needed for size values'''
+
+        return int(self._quantile * (size - 1))
+
+    def _return_value(self):
+        '''Return current value'''
+
+        lower, upper    = self._neighbours()
+        position        = self._quantile * (len(self._window) - 1)
+        fraction        = position - int(position)
+        if fraction == 0:
+            return lower
+        return lower + (upper - lower) * fraction
+
+    def __init__(self, length, quantile):
+        '''Initialise the class'''
+
+        if not isinstance(length, int):
+            raise TypeError("Length should be integral")
+        if length < 2:
+            raise ValueError('Parameter should be greater or equal 2')
+        if not 0 <= quantile <= 1:
+            raise ValueError('Quantile should be between 0 and 1')
+        self._length    = length
+        self._quantile  = quantile
+        if SortedList is None:
+            self._high      = _LazyHeap()
+            self._low       = _LazyHeap(largest = True)
+            self._sorted    = None
+        else:
+            self._high      = None
+            self._low       = None
+            self._sorted    = SortedList()
+        self._window    = deque()
+
+class MovingMedian(MovingQuantile):
+    '''
+    Median of the last length values, with the same interface as
+    MovingAverage
+    '''
+
+    __slots__ = ()
+
+    def _rank(self, size):
+        '''Rank of the lowest value needed for size values'''
+
+        return (size - 1) // 2
+
+    def _return_value(self):
+        '''Return current value'''
+
+        lower, upper = self._neighbours()
+        if len(self._window) % 2 == 1:
+            return lower
+        return (lower + upper) / 2
+
+    def __init__(self, length):
+        '''Initialise the class'''
+
+        MovingQuantile.__init__(self, length, 0.5)
+
+class Progress(object):
+    '''
+    Progress of a long loop, reported with a TimedMessage at most once per
+    interval seconds: how many are done, per second, the elapsed time and
+    (when the total is known) the percentage and the estimated time left
+    Iterate over Progress(iterable) or call update(n) as a counter
+    To keep the overhead low the time is only checked every check_every
+    items; finish() gives the last line
+    '''
+
+    def finish(self):
+        '''Report the final progress'''
+
+        self._report(monotonic())
+
+    def _report(self, now):
+        '''Give the progress line'''
+
+        self._next_report   = now + self._interval
+        elapsed             = now - self._start
+        rate                = self._done / elapsed if elapsed > 0 else 0.0
+        if self._total is None:
+            message = '{0} {1} {2}'.format(self._description, self._done, self._unit)
+        else:
+            message = '{0} {1} of {2} {3} ({4:.0%})'.format(
+                self._description, self._done, self._total, self._unit,
+                self._done / self._total if self._total else 1)
+        message += ', {0:.3E} {1}/s, elapsed {2}'.format(rate, self._unit,
+                                                         _format_duration(elapsed))
+        if (self._total is not None) and (rate > 0):
+            message += ', ETA {0}'.format(
+                _format_duration(max(0, self._total - self._done) / rate))
+        self._notifier.give_msg(message)
+
+    def update(self, n = 1):
+        '''n more items are done'''
+
+        self._done      += n
+        self._unchecked += n
+        if self._unchecked >= self._check_every:
+            self._unchecked = 0
+            now = monotonic()
+            if now >= self._next_report:
+                self._report(now)
+
+    def __iter__(self):
+        '''Give the items of iterable, counting them'''
+
+        check_every = self._check_every
+        countdown   = check_every
+        for item in self._iterable:
+            yield item
+            countdown -= 1
+            if countdown == 0:
+                self.update(check_every)
+                countdown = check_every
+        self._done += check_every - countdown
+        self.finish()
+
+    def __init__(self, iterable = None, total = None, notifier = None, interval = 10,
+                 check_every = 100, description = 'Done', unit = 'items'):
+        '''Initialise the class'''
+
+        if check_every < 1:
+            raise ValueError('check_every should be at least 1')
+        if (total is None) and (iterable is not None):
+            try:
+                total = len(iterable)
+            except TypeError:
+                pass
+        self._iterable      = iterable
+        self._total         = total
+        self._notifier      = TimedMessage() if notifier is None else notifier
+        self._interval      = interval
+        self._check_every   = check_every
+        self._description   = description
+        self._unit          = unit
+        self._done          = 0
+        self._unchecked     = 0
+        self._start         = monotonic()
+        self._next_report   = self._start + interval
+
+# Requests for the writer thread of TimedMessage
+_timed_message_flush    = object()
+_timed_message_stop     = object()
+
 class TimedMessage:
     '''
     For printing messages with time prepended before it
     Has the possibilty to keep time print blank for when several messages
     are send shortly after eachother.
     Also the possibilty to stay on the same line when things need to be appended
+
+    The messages go to stream, default stdout. The time is only formatted
+    again when the second changed.
+    With buffer_size and/or flush_interval the messages are buffered and
+    written when there are buffer_size characters or flush_interval seconds
+    passed; flush() writes them at once. Do not mix this with print.
+    With background = True a thread writes the messages, so give_msg never
+    waits on the stream. close() stops it. flush_interval needs background,
+    because only the thread can write when no messages are given.
     '''
 
+    def close(self):
+        '''Write the buffered messages and stop the writer thread'''
+
+        if self._thread is not None:
+            self._queue.put(_timed_message_stop)
+            self._thread.join()
+            self._thread = None
+        else:
+            self._flush_buffer()
+
+    def flush(self):
+        '''Write the buffered messages'''
+
+        if self._thread is not None:
+            self._queue.put(_timed_message_flush)
+            self._queue.join()
+        else:
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        '''Write the buffer to the stream'''
+
+        stream = self._stream or sys.stdout
+        if self._buffer:
+            stream.write(''.join(self._buffer))
+            del self._buffer[:]
+            self._buffer_length = 0
+        stream.flush()
+        self._last_flush = monotonic()
+
     def give_msg(self, message, show_time = True, use_newline = True):
         '''
-        Prints the message to stdout
+        Prints the message to the stream
         Use show_time = False when you do not want time
         Use use_newline = False if you do not want a newline
         '''
 
         if show_time:
-            time = strftime(self._format)
+            now = int(time())
+            if now != self._time_second:
+                self._time_second   = now
+                self._time_text     = strftime(self._format, localtime(now))
+            formatted_message = self._time_text + message
         else:
-            time = self._blank_time
-        formatted_message = time + message
+            formatted_message = self._blank_time + message
         if use_newline:
-            print(formatted_message)
+            formatted_message += '\n'
+        if self._thread is not None:
+            self._queue.put(formatted_message)
         else:
-            # To work with Python2 the flush is a seperate statement
-            sys.stdout.write(formatted_message)
-            sys.stdout.flush()
-
-    def __init__(self, format = '%H:%M:%S: '):
+            self._write(formatted_message)
+
+    def _run(self):
+        '''The writer thread'''
+
+        while True:
+            try:
+                text = self._queue.get(timeout = self._flush_interval)
+            except queue.Empty:
+                self._flush_buffer()
+                continue
+            if text is _timed_message_stop:
+                self._flush_buffer()
+                self._queue.task_done()
+                return
+            if text is _timed_message_flush:
+                self._flush_buffer()
+            else:
+                self._write(text)
+            self._queue.task_done()
+
+    def _write(self, text):
+        '''Write or buffer a formatted message'''
+
+        if not self._buffered:
+            stream = self._stream or sys.stdout
+            stream.write(text)
+            # Without a newline it would stay in the buffer of the stream
+            if not text.endswith('\n'):
+                stream.flush()
+            return
+        self._buffer.append(text)
+        self._buffer_length += len(text)
+        if ((self._buffer_size is not None) and
+            (self._buffer_length >= self._buffer_size)) or \
+           ((self._flush_interval is not None) and
+            (monotonic() - self._last_flush >= self._flush_interval)):
+            self._flush_buffer()
+
+    def __init__(self, format = '%H:%M:%S: ', stream = None, buffer_size = None,
+                 flush_interval = None, background = False):
         '''Initialise the class'''
 
-        self._format        = format
-        self._blank_time    = ' ' * len(strftime(self._format))
-
+        if (flush_interval is not None) and not background:
+            raise ValueError('flush_interval can only be used with background')
+        self._format            = format
+        self._blank_time        = ' ' * len(strftime(self._format))
+        # None is stdout, looked up when writing so redirecting works
+        self._stream            = stream
+        self._time_second       = None
+        self._time_text         = ''
+        self._buffer_size       = buffer_size
+        self._flush_interval    = flush_interval
+        self._buffered          = (buffer_size is not None) or (flush_interval is not None)
+        self._buffer            = []
+        self._buffer_length     = 0
+        self._last_flush        = monotonic()
+        self._queue             = None
+        self._thread            = None
+        if background:
+            self._queue         = queue.Queue()
+            self._thread        = threading.Thread(target = self._run)
+            self._thread.daemon = True
+            self._thread.start()
+            atexit.register(self.close)
+        elif self._buffered:
+            atexit.register(self.flush)
 
 ##### Functions
 
@@ -141,6 +1225,13 @@ def find(directory, to_match, ignore_case = False):
                 results.append(os.path.join(dirpath, filename))
     return results
 
+def _format_duration(seconds):
+    '''Format a number of seconds as H:MM:SS'''
+
+    minutes, seconds    = divmod(int(round(seconds)), 60)
+    hours, minutes      = divmod(minutes, 60)
+    return '{0}:{1:02d}:{2:02d}'.format(hours, minutes, seconds)
+
 def get_serialization(format, filename):
     '''General function for getting serialized data'''
 
@@ -172,6 +1263,82 @@ def human_readable_size(size, binary_form = True, to_large_is_error = True):
         raise ValueError('number too large')
     return '{0:.1f} {1}'.format(size, suffix)
 
+def human_readable_sizes(sizes, binary_form = True, to_large_is_error = True):
+    '''
+    human_readable_size for an iterable or NumPy array of sizes
+    Returns: list with the same strings as human_readable_size gives
+    With NumPy all sizes are done at once: the suffix is chosen from the
+    exponent of the size (like log2) and the strings come from a table.
+    For a NumPy array that is more as 10 times as fast as
+    human_readable_size per size, for a list the conversion to an array
+    takes a big part of the time: about 5 to 10 times as fast
+    '''
+
+    if numpy is not None:
+        if not isinstance(sizes, (numpy.ndarray, list, tuple)):
+            sizes = list(sizes)
+        values = numpy.asarray(sizes)
+        # For example ints that are to big for NumPy are done one by one
+        if (values.ndim == 1) and (values.dtype.kind in 'biuf'):
+            return _human_readable_sizes_numpy(values, binary_form, to_large_is_error)
+    return [human_readable_size(size, binary_form, to_large_is_error) for size in sizes]
+
+def _human_readable_sizes_numpy(sizes, binary_form, to_large_is_error):
+    '''human_readable_sizes for a NumPy array'''
+
+    values      = sizes.astype(float)
+    multiple    = 1024. if binary_form else 1000.
+    suffixes    = _size_suffixes[multiple]
+    with numpy.errstate(invalid = 'ignore', over = 'ignore'):
+        if binary_form:
+            # Dividing by 1024 is exact, so the exponent gives the suffix
+            exponents   = numpy.frexp(values)[1]
+            index       = numpy.maximum((exponents - 11) // 10, 0)
+            # frexp gives exponent 0 for inf and nan
+            to_large    = (index >= len(suffixes)) | ~numpy.isfinite(values)
+            index[to_large] = len(suffixes) - 1
+            scaled      = numpy.ldexp(values, -10 * (index + 1))
+        else:
+            # Dividing by 1000 rounds, so divide like human_readable_size
+            index   = numpy.zeros(len(values), dtype = int)
+            scaled  = values / multiple
+            for i in range(1, len(suffixes)):
+                larger = scaled >= multiple
+                if not larger.any():
+                    break
+                index  += larger
+                scaled  = numpy.where(larger, scaled / multiple, scaled)
+            to_large        = ~(scaled < multiple)
+            index[to_large] = len(suffixes) - 1
+        negative = values < 0
+        if to_large_is_error:
+            wrong = negative | to_large
+        else:
+            wrong = negative
+        if wrong.any():
+            if negative[numpy.argmax(wrong)]:
+                raise ValueError('number must be non-negative')
+            raise ValueError('number too large')
+        # Rounding to tenths, only near a half scaled * 10 can round wrong
+        tenths      = scaled * 10
+        rounded     = numpy.rint(tenths)
+        special     = (numpy.abs(tenths - numpy.floor(tenths) - 0.5) <=
+                       2 * numpy.spacing(tenths)) | \
+                      ~numpy.isfinite(tenths) | (rounded > 10 * multiple)
+    width       = int(10 * multiple) + 1
+    keys        = index * width + numpy.where(special, 0, rounded).astype(int)
+    result      = _size_table(multiple)[keys]
+    for i in numpy.flatnonzero(special):
+        result[i] = '{0:.1f} {1}'.format(float(scaled[i]), suffixes[index[i]])
+    result[values == 0] = '0'
+    return result.tolist()
+
+def _lock_file(f, exclusive):
+    '''Lock an open file, does nothing when fcntl is not available'''
+
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
 # In Clojure you have the memoize function
 # to cache values that need a long time to be computed
 # I implemented a Python version
@@ -183,7 +1350,12 @@ def human_readable_size(size, binary_form = True, to_large_is_error = True):
 # When called without a parameter the cache is emptied
 # Useful for testing performance with timeit
 # Description of its usefulness in memoize.md
-def memoize(function):
+#
+# The cache can be bounded, see _MemoizeStore
+# and it can be persistent, see _MemoizePersist
+def memoize(function = None, maxsize = None, policy = 'lru', max_bytes = None,
+            persist = None, persist_format = pickle, persist_batch = 100,
+            thread_safe = False, ttl = None, trampoline = False):
     '''
     Just put '@memoize' before a long running function like:
     @memoize
@@ -191,27 +1363,450 @@ def memoize(function):
     .
     .
     .
+
+    Or to bound the cache:
+    @memoize(maxsize = 1000, policy = 'lfu', max_bytes = 10 ** 6)
+
+    Or to keep the results over runs and share them between processes:
+    @memoize(persist = '~/cache/fib.db')
+
+    With thread_safe = True the cache is locked and when several threads
+    call with the same arguments at the same time, the function is only
+    called once: the other threads wait for its result.
+    An async def function is memoized in the same way for coroutines: calling
+    it returns an awaitable and one call with the same arguments is in flight.
+    With ttl a cached value is used at most ttl seconds, ttl can not be
+    combined with persist.
+    With trampoline = True a recursive function does not use the stack for
+    values that are not cached: the call raises and the value is calculated
+    first, after which the calling function is run again. So the function
+    should not have side effects and should not catch every exception.
+
+    The memoized function gets warm(values) to precompute: function is
+    called for every value in order, so a recursive function is filled
+    bottom-up without deep recursion.
+
+    The memoized function gets cache_info() (hits, misses, evictions,
+    maxsize, currsize and bytes), cache_clear() and cache_flush() (to
+    write the persistent results that are not written yet)
+    Clearing only empties the cache in memory, on the next miss the
+    persistent results are read again
     '''
 
+    if function is None:
+        return functools.partial(memoize, maxsize = maxsize, policy = policy,
+                                 max_bytes = max_bytes, persist = persist,
+                                 persist_format = persist_format,
+                                 persist_batch = persist_batch,
+                                 thread_safe = thread_safe, ttl = ttl,
+                                 trampoline = trampoline)
+
+    is_async = (asyncio is not None) and asyncio.iscoroutinefunction(function)
+    if trampoline and (thread_safe or is_async):
+        raise ValueError('trampoline can not be combined with thread_safe '
+                         'or an async function')
+    if thread_safe and (Future is None):
+        raise ImportError('thread_safe needs concurrent.futures')
+    # The persistent file does not keep when a value was calculated
+    if (persist is not None) and (ttl is not None):
+        raise ValueError('persist can not be combined with ttl')
     # Initialy nothing cached
-    S = {}
+    store       = _MemoizeStore(maxsize, policy, max_bytes, ttl)
+    persistent  = None
+    if persist is not None:
+        persistent = _MemoizePersist(persist, persist_format, persist_batch)
+    # Calls that are calculated at the moment, for thread_safe and async
+    in_flight   = {}
+    lock        = threading.Lock()
+    # Is a trampolined function being evaluated, per thread because the
+    # pending calls of a thread are on its own stack
+    evaluating  = threading.local()
+    # Local names are faster, memoize is often used for many cheap calls
+    values      = store.values
+    values_get  = values.get
+    store_hit   = store.hit
+    missing     = _memoize_missing
+    # Without bounds, ttl and persist the store is not needed: only the dictionary
+    # and the hits and misses (a list, because Python 2 has no nonlocal)
+    plain       = (maxsize is None) and (max_bytes is None) and (ttl is None) and \
+                  (persist is None) and (policy == 'lru')
+    counts      = [0, 0]
+
+    def clear():
+        '''Empty the cache in memory, the persistent results are read again'''
+
+        store.clear()
+        if persistent is not None:
+            persistent.reset()
+
+    def info():
+        '''cache_info of plain_function'''
+
+        return CacheInfo(counts[0], counts[1], 0, None, len(values), None)
+
+    def lookup(key):
+        '''Return the cached value of key, _memoize_missing when not cached'''
+
+        value = values.get(key, _memoize_missing)
+        if (value is not _memoize_missing) and (ttl is not None) and store.expired(key):
+            value = _memoize_missing
+        # Maybe it is calculated by an earlier run or another process
+        if (value is _memoize_missing) and (persistent is not None) and \
+           persistent.load(store):
+            value = values.get(key, _memoize_missing)
+        if value is not _memoize_missing:
+            store_hit(key)
+        return value
+
+    def save(key, value):
+        '''Cache a calculated value'''
+
+        store.put(key, value)
+        if persistent is not None:
+            persistent.append(key, value)
+
+    def plain_clear():
+        '''cache_clear of plain_function'''
+
+        values.clear()
+        counts[0] = counts[1] = 0
+
+    @functools.wraps(function)
+    def plain_function(*args, **kwargs):
+        '''
+        wrapping_function for an unbounded cache without ttl and persist,
+        like lru_cache(maxsize = None)
+        '''
 
-    def wrapping_function(*args):
+        if kwargs:
+            return plain_keywords(args, kwargs)
+        if not args:
+            plain_clear()
+            return None
+        value = values_get(args, missing)
+        if value is not missing:
+            counts[0] += 1
+            return value
+        value = values[args] = function(*args)
+        counts[1] += 1
+        return value
+
+    def plain_keywords(args, kwargs):
+        '''plain_function for a call with keyword arguments'''
+
+        key     = _memoize_key(args, kwargs)
+        value   = values_get(key, missing)
+        if value is not missing:
+            counts[0] += 1
+            return value
+        value = values[key] = function(*args, **kwargs)
+        counts[1] += 1
+        return value
+
+    # wraps gives wrapping_function the name of function, which also makes
+    # it picklable (for example to time it in another process)
+    @functools.wraps(function)
+    def wrapping_function(*args, **kwargs):
         '''
         This function will replace the function that is memoized
         When called without parameters it empties the cache
         '''
 
-        if len(args) == 0:
-            S.clear()
+        if (len(args) == 0) and (len(kwargs) == 0):
+            clear()
             return None
+        key = _memoize_key(args, kwargs) if kwargs else args
+        # Fast path for a value that is cached and can not be expired
+        value = values.get(key, _memoize_missing)
+        if (value is not _memoize_missing) and (ttl is None):
+            store_hit(key)
+            return value
         # When not cached calculate and cache
-        if args not in S:
-            S[args] = function(*args)
-        # return cached value
-        return S[args]
+        value = lookup(key)
+        if value is _memoize_missing:
+            value = function(*args, **kwargs)
+            save(key, value)
+        return value
+
+    @functools.wraps(function)
+    def thread_safe_function(*args, **kwargs):
+        '''
+        wrapping_function for thread_safe
+        Only the first caller for a key calculates, the others wait for it
+        '''
+
+        if (len(args) == 0) and (len(kwargs) == 0):
+            with lock:
+                clear()
+            return None
+        key = _memoize_key(args, kwargs) if kwargs else args
+        with lock:
+            value = lookup(key)
+            if value is not _memoize_missing:
+                return value
+            future  = in_flight.get(key)
+            owner   = future is None
+            if owner:
+                future = in_flight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            value = function(*args, **kwargs)
+        except BaseException as error:
+            with lock:
+                del in_flight[key]
+            future.set_exception(error)
+            raise
+        with lock:
+            save(key, value)
+            del in_flight[key]
+        future.set_result(value)
+        return value
+
+    @functools.wraps(function)
+    def async_function(*args, **kwargs):
+        '''
+        wrapping_function for an async def function
+        Returns an awaitable; callers for a key that is in flight share its task
+        '''
+
+        loop = asyncio.get_event_loop()
+        if (len(args) == 0) and (len(kwargs) == 0):
+            clear()
+            value = None
+        else:
+            key     = _memoize_key(args, kwargs) if kwargs else args
+            value   = lookup(key)
+        if value is not _memoize_missing:
+            future = loop.create_future()
+            future.set_result(value)
+            return future
+        task = in_flight.get(key)
+        if task is None:
+            task = in_flight[key] = asyncio.ensure_future(function(*args, **kwargs))
+            task.add_done_callback(functools.partial(async_done, key))
+        # With shield a cancelled caller does not cancel the others
+        return asyncio.shield(task)
+
+    def async_done(key, task):
+        '''Cache the result of a finished task'''
+
+        in_flight.pop(key, None)
+        if (not task.cancelled()) and (task.exception() is None):
+            save(key, task.result())
+
+    @functools.wraps(function)
+    def trampoline_function(*args, **kwargs):
+        '''
+        wrapping_function for trampoline
+        Values that are needed, but not cached, are calculated with an
+        explicit stack instead of recursion
+        '''
+
+        if (len(args) == 0) and (len(kwargs) == 0):
+            clear()
+            return None
+        key     = _memoize_key(args, kwargs) if kwargs else args
+        value   = lookup(key)
+        if value is not _memoize_missing:
+            return value
+        if getattr(evaluating, 'active', False):
+            raise _MemoizeDeferred(args, kwargs)
+        evaluating.active   = True
+        pending             = [(args, kwargs)]
+        try:
+            while pending:
+                call_args, call_kwargs = pending[-1]
+                try:
+                    value = function(*call_args, **call_kwargs)
+                except _MemoizeDeferred as deferred:
+                    pending.append(deferred.call)
+                    continue
+                pending.pop()
+                save(_memoize_key(call_args, call_kwargs) if call_kwargs else call_args,
+                     value)
+        finally:
+            evaluating.active = False
+        return value
+
+    def warm(values):
+        '''
+        Precompute: call the memoized function for every value in order
+        For a recursive function give the values from low to high
+        '''
+
+        for value in values:
+            result_function(value)
+
+    if is_async:
+        result_function = async_function
+    elif thread_safe:
+        result_function = thread_safe_function
+    elif trampoline:
+        result_function = trampoline_function
+    elif plain:
+        result_function = plain_function
+    else:
+        result_function = wrapping_function
+    if result_function is plain_function:
+        result_function.cache_clear = plain_clear
+        result_function.cache_info  = info
+    else:
+        result_function.cache_clear = clear
+        result_function.cache_info  = store.info
+    result_function.cache_flush = persistent.flush if persistent is not None \
+                                  else (lambda: None)
+    # Calling an async function for a value does not calculate it yet
+    if not is_async:
+        result_function.warm    = warm
+    return result_function
+
+# Separates args and kwargs in a key and marks a value as not cached
+_memoize_mark       = _MemoizeMark()
+_memoize_missing    = object()
+
+def _memoize_key(args, kwargs):
+    '''
+    Key for the cache of memoize
+    The order in which keyword arguments are given does not matter
+    '''
 
-    return wrapping_function
+    return args + (_memoize_mark,) + tuple(sorted(kwargs.items()))
+
+def _moving_average_chunk(filename, typecode, length, start, end, output, precise):
+    '''
+    Moving average of the values start upto end of filename for
+    moving_average_file, seeded with the length - 1 values before start
+    Returns the values, or with output writes them there
+    '''
+
+    size = array(typecode).itemsize
+    with open(filename, 'rb') as in_f:
+        data = mmap.mmap(in_f.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            average = MovingAverage(length, precise)
+            average.seed(array(typecode, data[max(0, start - length + 1) * size:
+                                              start * size]))
+            values  = array(typecode, data[start * size:end * size])
+        finally:
+            data.close()
+    if numpy is not None:
+        values = numpy.frombuffer(values, dtype = typecode)
+    result = average.next_values(values)
+    if output is None:
+        return result
+    with open(output, 'r+b') as out_f:
+        out_f.seek(start * 8)
+        # Python 2 arrays only have tostring
+        out_f.write(result.tobytes() if hasattr(result, 'tobytes') else result.tostring())
+    return None
+
+def moving_average_file(filename, length, output = None, typecode = 'd',
+                        chunk_size = 10 ** 6, workers = None, precise = False):
+    '''
+    Moving average of a binary file with values of array typecode typecode,
+    for files that are to big for memory or a single core
+    The file is split in chunks of chunk_size values that are done in a
+    process pool. Every chunk starts with a MovingAverage seeded with the
+    length - 1 values before it; the values are read through mmap.
+    The chunks are put back in order: with output the results are written
+    as doubles to that file, otherwise they are returned in an array
+    (a NumPy array with NumPy)
+    Because every chunk starts with a fresh total the results can differ in
+    the last bits from one MovingAverage over the whole file
+    '''
+
+    if chunk_size < 1:
+        raise ValueError('Chunk size should be at least 1')
+    if ProcessPoolExecutor is None:
+        raise ImportError('moving_average_file needs concurrent.futures')
+    filename    = expanduser(filename)
+    size        = array(typecode).itemsize
+    file_size   = os.path.getsize(filename)
+    if file_size % size != 0:
+        raise ValueError('The size of {0} is not a multiple of {1}'.format(filename, size))
+    n           = file_size // size
+    if output is not None:
+        output = expanduser(output)
+        with open(output, 'wb') as out_f:
+            out_f.truncate(n * 8)
+    starts      = range(0, n, chunk_size)
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        futures = [executor.submit(_moving_average_chunk, filename, typecode, length,
+                                   start, min(start + chunk_size, n), output, precise)
+                   for start in starts]
+        results = [future.result() for future in futures]
+    if output is not None:
+        return None
+    if numpy is not None:
+        return numpy.concatenate(results) if results else numpy.empty(0)
+    result = array('d')
+    for part in results:
+        result.extend(part)
+    return result
+
+def _moving_totals(ring, count, position, total, block):
+    '''
+    Return the totals of a moving window after every value of block and the
+    values of the window followed by block
+    ring is the ring buffer of the window with count values and the oldest at
+    position, total the current total. The rolling total is done with
+    add.accumulate over the additions and subtractions in the order of
+    MovingAverage.next_value, so it rounds the same.
+    '''
+
+    length  = len(ring)
+    n       = len(block)
+    if count < length:
+        window = ring[:count]
+    else:
+        window = numpy.concatenate((ring[position:], ring[:position]))
+    values  = numpy.concatenate((window, block))
+    # Step k removes values[count + k - length] when the window is full
+    removed = numpy.zeros(n)
+    first   = max(0, length - count)
+    if first < n:
+        removed[first:] = values[count + first - length:count + n - length]
+    steps       = numpy.empty(2 * n + 1)
+    steps[0]    = total
+    steps[1::2] = block
+    steps[2::2] = -removed
+    # An overflow is handled by the caller
+    with numpy.errstate(over = 'ignore'):
+        return numpy.add.accumulate(steps)[2::2], values
+
+def parallel_sweep(check, values, chunk_size = 10, workers = None, notifier = None,
+                   interval = 10):
+    '''
+    Run check for all values in a process pool and give the mismatches
+    check gets one value and returns a list of messages, empty when OK
+    It has to be picklable, so it has to be defined at module level
+    The values are split in chunks of chunk_size and the messages of a chunk
+    are given as soon as the chunk is done, so not in the order of values
+    A worker keeps its process for several chunks, so caches are reused
+    When a notifier (TimedMessage) is given the progress is reported with it
+    at most once per interval seconds
+    '''
+
+    if chunk_size < 1:
+        raise ValueError('Chunk size should be at least 1')
+    if ProcessPoolExecutor is None:
+        raise ImportError('parallel_sweep needs concurrent.futures')
+    values      = list(values)
+    chunks      = [values[i : i + chunk_size] for i in range(0, len(values), chunk_size)]
+    if notifier is not None:
+        progress = Progress(total = len(values), notifier = notifier, interval = interval,
+                            check_every = 1, description = 'Checked', unit = 'values')
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        futures = dict((executor.submit(_sweep_chunk, check, chunk), len(chunk))
+                       for chunk in chunks)
+        for future in as_completed(futures):
+            for message in future.result():
+                yield message
+            if notifier is not None:
+                progress.update(futures[future])
+    if notifier is not None:
+        progress.finish()
 
 def save_serialization(format, data, filename):
     '''General function for serializing data'''
@@ -219,6 +1814,28 @@ def save_serialization(format, data, filename):
     with open(expanduser(filename), 'wb') as out_f:
         format.dump(data, out_f)
 
+# The strings for every suffix and every number of tenths, per multiple
+_size_tables = {}
+
+def _size_table(multiple):
+    '''The NumPy array with the strings for human_readable_sizes'''
+
+    if multiple not in _size_tables:
+        width = int(10 * multiple) + 1
+        _size_tables[multiple] = numpy.array(
+            ['{0}.{1} {2}'.format(tenths // 10, tenths % 10, suffix)
+             for suffix in _size_suffixes[multiple] for tenths in range(width)],
+            dtype = object)
+    return _size_tables[multiple]
+
+def _sweep_chunk(check, chunk):
+    '''Run check for every value in chunk and return all messages'''
+
+    messages = []
+    for value in chunk:
+        messages.extend(check(value))
+    return messages
+
 ### Extension: instead of printing the needed time return it
 def time_fetchURLs(server, URLs, times, wait_between_fetches):
     '''
@@ -250,6 +1867,12 @@ def time_fetchURLs(server, URLs, times, wait_between_fetches):
         sleep(wait_between_fetches)
         _read_urls()
 
+def _unlock_file(f):
+    '''Unlock a file locked with _lock_file'''
+
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+
 
 ##### Test functions
 
@@ -283,9 +1906,102 @@ def test_moving_average(length, input_array, output_array, notify):
             notify.give_msg('Got {0} instead of {1} for the {2} value'. \
                 format(gotten, expected, i))
             error = True
+    # next_values in two blocks should give the same as next_value
+    average     = MovingAverage(length)
+    single      = MovingAverage(length)
+    middle      = length // 2
+    gotten      = list(average.next_values(input_array[:middle])) + \
+                  list(average.next_values(input_array[middle:]))
+    expected    = [single.next_value(value) for value in input_array]
+    if gotten != expected:
+        notify.give_msg('next_values gives {0} instead of {1}'.format(gotten, expected))
+        error = True
     if not error:
         notify.give_msg('Moving average OK for length {0}'.format(length))
 
+def test_moving_average_bank(length, n_series, n, notify):
+    '''
+    For testing that MovingAverageBank gives the same values as a
+    MovingAverage for every series
+    '''
+
+    notify.give_msg('Moving average bank length {0} with {1} series:'.
+                    format(length, n_series))
+    rnd         = random.Random(length)
+    bank        = MovingAverageBank(length, n_series)
+    averages    = [MovingAverage(length) for i in range(n_series)]
+    error       = False
+    # Small batches, so the same series is often more as once in a batch
+    for start in range(0, n, 50):
+        series_ids  = [rnd.randrange(n_series) for i in range(50)]
+        values      = [rnd.gauss(0, 100) for i in range(50)]
+        gotten      = list(bank.update(series_ids, values))
+        expected    = [averages[series].next_value(value)
+                       for series, value in zip(series_ids, values)]
+        if gotten != expected:
+            notify.give_msg('update gives {0} instead of {1}'.format(gotten, expected))
+            error = True
+            break
+    expected = [average.current_value() for average in averages]
+    gotten   = [None if value != value else value for value in bank.current_values()]
+    if gotten != expected:
+        notify.give_msg('current_values gives {0} instead of {1}'.format(gotten, expected))
+        error = True
+    if not error:
+        notify.give_msg('Moving average bank OK for length {0}'.format(length))
+
+def test_moving_windows(length, values, notify):
+    '''
+    For testing the functionality of MovingMaximum, MovingMedian,
+    MovingMinimum and MovingQuantile against calculating every window again
+    '''
+
+    def quantile(window, q):
+        ordered     = sorted(window)
+        position    = q * (len(ordered) - 1)
+        low         = int(position)
+        fraction    = position - low
+        if fraction == 0:
+            return ordered[low]
+        return ordered[low] + (ordered[low + 1] - ordered[low]) * fraction
+
+    def median(window):
+        ordered = sorted(window)
+        middle  = len(ordered) // 2
+        if len(ordered) % 2 == 1:
+            return ordered[middle]
+        return (ordered[middle - 1] + ordered[middle]) / 2
+
+    notify.give_msg('Moving windows length {0}:'.format(length))
+    error = False
+    for description, moving, naive in [
+            ('maximum',         MovingMaximum(length),          max),
+            ('median',          MovingMedian(length),           median),
+            ('minimum',         MovingMinimum(length),          min),
+            ('quantile 0.1',    MovingQuantile(length, 0.1),
+             lambda window: quantile(window, 0.1)),
+            ('quantile 0.75',   MovingQuantile(length, 0.75),
+             lambda window: quantile(window, 0.75)),
+    ]:
+        if moving.current_value() != None:
+            notify.give_msg('Starting with current_value did not give None for {0}'.
+                            format(description))
+            error = True
+        for i in range(len(values)):
+            gotten      = moving.next_value(values[i])
+            expected    = naive(values[max(0, i + 1 - length):i + 1])
+            if gotten != expected:
+                notify.give_msg('Moving {0}: got {1} instead of {2} for the {3} value'.
+                                format(description, gotten, expected, i))
+                error = True
+                break
+        if moving.current_value() != gotten:
+            notify.give_msg('current_value does not return last calculated value for {0}'.
+                            format(description))
+            error = True
+    if not error:
+        notify.give_msg('Moving windows OK for length {0}'.format(length))
+
 
 ##### Init
 
@@ -314,6 +2030,8 @@ del format_in, format_out
 
 
 if __name__ == '__main__':
+    import tempfile
+
     from timeit import timeit
 
     notify          = TimedMessage()
@@ -371,6 +2089,34 @@ if __name__ == '__main__':
                                time_fibonacci, time_fibonacci_mem))
     print('')
 
+    notify.give_msg('Testing bounded memoize')
+    Error = False
+    for policy, expected in [
+            ('lru', CacheInfo(1, 5, 2, 3, 3, None)),
+            ('lfu', CacheInfo(1, 5, 2, 3, 3, None)),
+    ]:
+        @memoize(maxsize = 3, policy = policy)
+        def double(n, factor = 2):
+            return factor * n
+
+        for n in [1, 2, 3, 1, 4, 5]:
+            double(n)
+        if double.cache_info() != expected:
+            notify.give_msg('Wrong cache_info for {0}: {1}'.
+                            format(policy, double.cache_info()))
+            Error = True
+        if (double(1, factor = 3) != 3) or (double(n = 1) != 2):
+            notify.give_msg('Keyword arguments not handled correctly for {0}'.
+                            format(policy))
+            Error = True
+        double()
+        if double.cache_info() != CacheInfo(0, 0, 0, 3, 0, None):
+            notify.give_msg('Calling without parameters did not clear the cache')
+            Error = True
+    if not Error:
+        notify.give_msg('Bounded memoize OK')
+    print('')
+
     size = 0
     print(human_readable_size(size, False))
     print(human_readable_size(size))
@@ -378,6 +2124,12 @@ if __name__ == '__main__':
         size = 10 ** i
         print(human_readable_size(size, False))
         print(human_readable_size(size))
+    sizes = [0] + [size * 10 ** i for i in range(16) for size in range(1, 2000, 7)]
+    for binary_form in [False, True]:
+        if human_readable_sizes(sizes, binary_form) != \
+           [human_readable_size(size, binary_form) for size in sizes]:
+            notify.give_msg('human_readable_sizes does not give the same as '
+                            'human_readable_size (binary_form {0})'.format(binary_form))
 
     # For testing moving average, if someone wants to give real big sets …
     input06 = [
@@ -415,3 +2167,75 @@ if __name__ == '__main__':
     test_moving_average( 6, input06, output06, notify)
     test_moving_average(10, input10, output10, notify)
     print('')
+
+    test_moving_average_bank(  2,   5, 1000, notify)
+    test_moving_average_bank(100, 300, 5000, notify)
+    # A MovingAverage for every series against one MovingAverageBank
+    length      = 100
+    n_series    = 10 ** 4
+    n           = 10 ** 6
+    rnd         = random.Random(0)
+    series_ids  = [rnd.randrange(n_series) for i in range(n)]
+    values      = [rnd.gauss(0, 1) for i in range(n)]
+    averages    = [MovingAverage(length) for i in range(n_series)]
+    start       = time()
+    for series, value in zip(series_ids, values):
+        averages[series].next_value(value)
+    notify.give_msg('{0} values for {1} MovingAverage objects: {2:.3E} seconds'.
+                    format(n, n_series, time() - start))
+    bank        = MovingAverageBank(length, n_series)
+    # The data normally is already in an array
+    if numpy is not None:
+        series_ids  = numpy.array(series_ids)
+        values      = numpy.array(values)
+    start       = time()
+    for i in range(0, n, 10 ** 4):
+        bank.update(series_ids[i:i + 10 ** 4], values[i:i + 10 ** 4])
+    notify.give_msg('{0} values for a MovingAverageBank in batches of {1}: '
+                    '{2:.3E} seconds'.format(n, 10 ** 4, time() - start))
+    print('')
+
+    notify.give_msg('Testing moving_average_file')
+    rnd         = random.Random(0)
+    values      = array('d', [rnd.gauss(50, 1) for i in range(10 ** 5)])
+    filename    = os.path.join(tempfile.mkdtemp(), 'series.bin')
+    with open(filename, 'wb') as out_f:
+        out_f.write(values.tobytes() if hasattr(values, 'tobytes') else values.tostring())
+    expected    = MovingAverage(100).next_values(values)
+    gotten      = moving_average_file(filename, 100, chunk_size = 3 * 10 ** 4)
+    os.remove(filename)
+    if (len(gotten) != len(expected)) or \
+       (max(abs(x - y) for x, y in zip(gotten, expected)) > 1e-9):
+        notify.give_msg('moving_average_file does not give the same as MovingAverage')
+    else:
+        notify.give_msg('moving_average_file OK')
+    print('')
+
+    rnd     = random.Random(0)
+    values  = [rnd.randint(0, 20) for i in range(1000)]
+    test_moving_windows( 2, values, notify)
+    test_moving_windows(10, values, notify)
+    values  = [rnd.gauss(0, 1) for i in range(1000)]
+    test_moving_windows(99, values, notify)
+    print('')
+
+    # A big offset that comes and goes makes the rolling total drift
+    length  = 100
+    n       = 2 * 10 ** 5
+    rnd     = random.Random(0)
+    values  = [rnd.gauss(0, 1) + (1e9 if i % 1000 < 500 else 0.0) for i in range(n)]
+    exact   = math.fsum(values[-length:]) / length
+    notify.give_msg('Drift of moving average with length {0} after {1} values'.
+                    format(length, n))
+    for description, kwargs in [
+            ('rolling',             {}),
+            ('precise',             {'precise': True}),
+            ('resum every value',   {'precise': True, 'resum_every': 1}),
+    ]:
+        average = MovingAverage(length, **kwargs)
+        start   = time()
+        for value in values:
+            result = average.next_value(value)
+        notify.give_msg('{0:17}: {1:.3E} seconds, error {2:.3E}'.
+                        format(description, time() - start, abs(result - exact)))
+    print('')